@@ -20,7 +20,7 @@ from processing.utils import create_path
 from processing.phases import PhaseTask
 from processing.pipeline import PipelineManager
 from processing.tasks.process_task import (
-    bin2csv, seg_csv, bio_analisis, move_analisis
+    bin2csv, seg_csv, bio_analisis, move_analisis, validate_bin_file
 )
 from processing.store import PIPELINE_STORE
 #from process_manager import start_process, monitor_process
@@ -473,15 +473,23 @@ def validate_and_save_form(n_clicks, id_paciente, nombre, fecha_nacimiento, sexo
                 else:  # 'move'
                     shutil.move(file_path, new_filepath)
 
+                # Validación rápida del BIN (CRC, tamaños): deja bin_integrity.json en 00_bin
+                integrity = validate_bin_file(new_filepath)
+
                 # Ruta al directorio 00_bin
                 start_json_path = Path(new_binpath) / "start_bin.json"
                 # Contenido minimalista al estilo PhaseTask:
-                start_data = {"name": "start_bin", "status": "SUCCESS", "timestamp": time.time()}
+                start_data = {"name": "start_bin", "status": "SUCCESS" if integrity['valid'] else "ERROR",
+                              "timestamp": time.time()}
                 # Aseguramos que exista la carpeta (debería ya existir porque acabamos de crear new_binpath)
                 start_json_path.parent.mkdir(parents=True, exist_ok=True)
                 # Escribimos el JSON
                 start_json_path.write_text(json.dumps(start_data, indent=2))
 
+                # Un BIN dañado no se encola: se evita lanzar el pipeline completo
+                if not integrity['valid']:
+                    return f"El archivo BIN no es válido ({integrity['reason']}). No se ha iniciado el procesamiento."
+
                 folder = f"{id_paciente}_{today.replace('-', '.')}"
                 csv_path = create_path(1, id_paciente, folder)
                 bin2csv_path = Path(csv_path) / "bin2csv.json"
@@ -23,6 +23,7 @@ from webdriver_manager.chrome import ChromeDriverManager
 import pymupdf
 
 from processing.utils import create_path, purge_patient_data
+from processing.hr_summary import load_hr_segments, hr_summary, DIAS_SEMANA
 from processing.config import settings
 
 # Página que muestra el informe del paciente con los datos recopilados en la sesión X
@@ -1648,6 +1649,60 @@ def get_sleep_habits(datos, datos_move):
         ], style={"width": "102%", "border": "1px solid black", "border-collapse": "collapse", "margin-bottom": "0px"})
     ], style={"padding": "5px", "margin-bottom": "0px"})
 
+def get_frecuencia_cardiaca(data_path):
+    # Frecuencia cardiaca media por día de la semana (03_bio/HR_seg.csv); vacío si la sesión no la tiene
+    segments = load_hr_segments(str(data_path))
+    if segments is None or not (segments.N > 0).any():
+        return html.Div()
+
+    df_hr = hr_summary(segments, 'DiaSemana')
+    df_hr = df_hr[df_hr.N > 0].set_index('DiaSemana').reindex(DIAS_SEMANA).reset_index()
+    bar_hr = go.Figure(go.Bar(
+        x=df_hr['DiaSemana'], y=df_hr['Media'].round(1),
+        error_y=dict(type='data', array=df_hr['STD'].round(1), visible=True),
+        text=[f"{v:.0f}" if np.isfinite(v) else "" for v in df_hr['Media']],
+        textposition="inside", marker_color="#81c784"
+    ))
+    bar_hr.update_layout(
+        title="Frecuencia cardiaca media por día de la semana",
+        title_x=0.5,
+        title_font_size=20,
+        xaxis_title="Día de la semana",
+        yaxis_title="Frecuencia cardiaca (lpm)",
+        margin=dict(l=20, r=20, t=40, b=20),
+        height=320,
+    )
+
+    return html.Div([
+        html.Table([
+            html.Tbody([
+                html.Tr([
+                    html.Th("FRECUENCIA CARDIACA",
+                            colSpan=2, className="table-titles",
+                            style={"background-color": "#81c784", "text-align": "center",
+                                   "font-size": "20px", "font-weight": "bold", "padding": "10px",
+                                   "border": "1px solid black", "color": "#003366"})
+                ]),
+                html.Tr([
+                    html.Td(
+                        dcc.Graph(figure=bar_hr, style={"width": "100%", "height": "100%"}),
+                        colSpan=2,
+                        style={"width": "100%", "height": "100%", "padding": "10px",
+                               "border": "1px solid black", "boxSizing": "border-box"}
+                    )
+                ]),
+                html.Tr([
+                    html.Td([
+                        "Este gráfico muestra la frecuencia cardiaca media de cada día de la semana durante la evaluación"
+                        " y, con la línea vertical, su variabilidad (desviación típica) a lo largo del día."
+                    ], colSpan=2,
+                        style={"text-align": "left", "lineHeight": "1.4", "font-size": "18px", "font-family": "Verdana, sans-serif", "padding": "10px",
+                               "border": "1px solid black"})
+                ]),
+            ])
+        ], style={"width": "102%", "border": "1px solid black", "border-collapse": "collapse", "margin-bottom": "0px"})
+    ], style={"padding": "5px", "margin-bottom": "0px"})
+
 def layout(patient_id=None, fecha=None, render_mode="web", **kwargs):
     global dataPath
 
@@ -1705,6 +1760,7 @@ def layout(patient_id=None, fecha=None, render_mode="web", **kwargs):
         get_comportamiento_sedentario(datos_movimiento),
         riesgo_comb_act_fisica_sedentarismo(datos_movimiento),
         get_sleep_habits(datos_paciente, datos_movimiento),
+        get_frecuencia_cardiaca(dataPath),
     ])
 
 def generate_pdf(patient_id, patient_date):
@@ -17,6 +17,22 @@ class Settings(BaseSettings):
     watch_directory: DirectoryPath
 
     purge_after_pdf: bool = Field(default=False, alias="PURGE_AFTER_PDF")
+    raw_format: str = Field(default="csv", alias="RAW_FORMAT")  # csv | parquet | feather
+    bin2csv_workers: int = Field(default=1, alias="BIN2CSV_WORKERS")  # 0 = todos los núcleos
+    bin_max_bad_ratio: float = Field(default=0.5, alias="BIN_MAX_BAD_RATIO")  # 0..1
+    fused_segmentation: bool = Field(default=False, alias="FUSED_SEGMENTATION")  # BIN -> 02_seg sin 01_raw
+    seg_storage: str = Field(default="folders", alias="SEG_STORAGE")  # folders | store
+    stream_rhythm: bool = Field(default=False, alias="STREAM_RHYTHM")  # HR_seg/HR_day durante la segmentación
+    seg_windows: str = Field(default="5", alias="SEG_WINDOWS")  # minutos, p. ej. "1,5,60"
+    seg_write_behind: bool = Field(default=False, alias="SEG_WRITE_BEHIND")  # hilo de escritura de 02_seg
+    seg_memory_mb: int = Field(default=0, alias="SEG_MEMORY_MB")  # techo de memoria de la segmentación, 0 = sin techo
+    seg_timezone: str = Field(default="", alias="SEG_TIMEZONE")  # zona IANA, vacío = la del sistema
+    rhythm_workers: int = Field(default=1, alias="RHYTHM_WORKERS")  # 0 = todos los núcleos
+    r_workers: int = Field(default=0, alias="R_WORKERS")  # workers persistentes de R, 0 = un Rscript por paciente
+    r_worker_port: int = Field(default=47800, alias="R_WORKER_PORT")  # primer puerto local de los workers
+    r_worker_idle_minutes: int = Field(default=30, alias="R_WORKER_IDLE_MINUTES")  # sin trabajos, el worker termina
+    move_batch_size: int = Field(default=1, alias="MOVE_BATCH_SIZE")  # sesiones por GGIR en lote, 1 = sin lotes
+    move_batch_cores: int = Field(default=0, alias="MOVE_BATCH_CORES")  # núcleos del GGIR en lote, 0 = todos
 
     class Config:
         # Ubicación del archivo .env en el paquete
@@ -0,0 +1,95 @@
+# hr_summary.py
+"""
+Resúmenes de frecuencia cardiaca a partir de las estadísticas por segmento de
+03_bio/HR_seg.csv (Media, STD, Maximo, Minimo, y N, Suma y SumaCuadrados de las
+muestras con hr>0).
+
+Cada grupo (día, hora del día o día de la semana) combina los estadísticos suficientes
+de sus segmentos, que son enteros y se suman sin error:
+    media = sum(Suma) / sum(N)
+    var = sum(SumaCuadrados) / sum(N) - media²
+que es la varianza de todas las muestras del grupo (no la dispersión de las STD).
+Los segmentos sin frecuencia cardiaca (N = 0, valores -1) no cuentan; un grupo sin
+ninguna muestra queda con -1, igual que los segmentos.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+# Columna de agrupación de cada resumen y fichero de 03_bio en el que se guarda
+SUMMARY_FILES = {'Fecha': 'HR_day.csv', 'Hora': 'HR_hour.csv', 'DiaSemana': 'HR_weekday.csv'}
+
+def load_hr_segments(dir_path):
+    """
+    HR_seg.csv de la sesión `dir_path`, o None si no existe. En los ficheros anteriores
+    a las columnas Suma y SumaCuadrados se reconstruyen a partir de Media y STD
+    (redondeadas, así que los resúmenes son aproximados), y sin columna N todos los
+    segmentos con frecuencia cardiaca pesan lo mismo (N = 1).
+    """
+    path = os.path.join(dir_path, "03_bio", "HR_seg.csv")
+    if not os.path.exists(path):
+        return None
+    segments = pd.read_csv(path, dtype={'Fecha': str})
+    if 'N' not in segments.columns:
+        segments['N'] = (segments.Media >= 0).astype(np.int64)
+    if 'Suma' not in segments.columns:
+        valid = segments.N > 0
+        segments['Suma'] = np.where(valid, segments.N * segments.Media, 0)
+        segments['SumaCuadrados'] = np.where(valid, segments.N * (segments.STD ** 2 + segments.Media ** 2), 0)
+    return segments
+
+def hr_summary(segments, by='Fecha'):
+    """
+    Resumen de `segments` (DataFrame con las columnas de HR_seg.csv) por 'Fecha',
+    'Hora' (hora del día, 00-23) o 'DiaSemana'. Devuelve un DataFrame con la columna
+    de agrupación y Media, STD (sin redondear), Maximo, Minimo y N, en orden de la
+    agrupación.
+    """
+    keys = summary_keys(segments, by)
+    valid = segments.N.to_numpy() > 0
+
+    data = pd.DataFrame({
+        by: keys,
+        'n': np.where(valid, segments.N.to_numpy(dtype=np.float64), 0),
+        'sum': np.where(valid, segments.Suma.to_numpy(dtype=np.float64), 0),
+        'squares': np.where(valid, segments.SumaCuadrados.to_numpy(dtype=np.float64), 0),
+        'Maximo': segments.Maximo.where(valid),
+        'Minimo': segments.Minimo.where(valid),
+    })
+    grouped = data.groupby(by, sort=True).agg(
+        n=('n', 'sum'), sum=('sum', 'sum'), squares=('squares', 'sum'),
+        Maximo=('Maximo', 'max'), Minimo=('Minimo', 'min'))
+
+    total = grouped.n.to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = grouped['sum'].to_numpy() / total
+        variance = np.maximum(grouped.squares.to_numpy() / total - mean ** 2, 0)
+    empty = total == 0
+    summary = pd.DataFrame({
+        by: grouped.index,
+        'Media': np.where(empty, -1, mean),
+        'STD': np.where(empty, -1, np.sqrt(variance)),
+        'Maximo': grouped.Maximo.fillna(-1).to_numpy(),
+        'Minimo': grouped.Minimo.fillna(-1).to_numpy(),
+        'N': total.astype(np.int64),
+    })
+    if by == 'DiaSemana':
+        summary[by] = [DIAS_SEMANA[day] for day in summary[by]]
+    return summary
+
+def summary_keys(segments, by):
+    # Fecha 'YYYY.MM.DD'; la hora sale de la columna Hora ('HH:MM...')
+    if by == 'Fecha':
+        return segments.Fecha.astype(str).to_numpy()
+    if by == 'Hora':
+        return segments.Hora.astype(str).str[:2].to_numpy()
+    if by == 'DiaSemana':
+        return pd.to_datetime(segments.Fecha.astype(str), format='%Y.%m.%d').dt.dayofweek.to_numpy()
+    raise ValueError(f"Agrupación de HR inválida: {by}")
+
+def write_hr_summaries(dir_path, segments):
+    # HR_day.csv, HR_hour.csv y HR_weekday.csv en 03_bio
+    for by, fileName in SUMMARY_FILES.items():
+        hr_summary(segments, by).round({'Media': 2, 'STD': 3}).to_csv(os.path.join(dir_path, "03_bio", fileName))
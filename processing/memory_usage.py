@@ -0,0 +1,57 @@
+# memory_usage.py
+"""
+Memoria del proceso actual (RSS) sin dependencias externas: `resource` en Linux/macOS
+y GetProcessMemoryInfo (psapi) en Windows. Devuelve None si no se puede medir.
+"""
+import sys
+
+def peak_rss_mb():
+    # Pico de memoria residente del proceso desde que arrancó, en MB
+    if sys.platform == 'win32':
+        counters = _windows_memory_counters()
+        return None if counters is None else round(counters.PeakWorkingSetSize / 2 ** 20, 1)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss va en KB en Linux y en bytes en macOS
+    return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+def current_rss_mb():
+    # Memoria residente actual del proceso, en MB
+    if sys.platform == 'win32':
+        counters = _windows_memory_counters()
+        return None if counters is None else round(counters.WorkingSetSize / 2 ** 20, 1)
+    try:
+        with open('/proc/self/statm', 'r') as statmFile:
+            pages = int(statmFile.read().split()[1])
+        import os
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+    except (OSError, ValueError, IndexError):
+        # Sin /proc (macOS): el pico es la mejor aproximación disponible
+        return peak_rss_mb()
+
+def _windows_memory_counters():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+    try:
+        getCurrentProcess = ctypes.windll.kernel32.GetCurrentProcess
+        getCurrentProcess.restype = wintypes.HANDLE
+        getProcessMemoryInfo = ctypes.windll.psapi.GetProcessMemoryInfo
+        getProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+        if not getProcessMemoryInfo(getCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None
+    except (AttributeError, OSError):
+        return None
+    return counters
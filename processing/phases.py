@@ -24,6 +24,17 @@ def _run_phase(fn, args):
         import asyncio as _asyncio
         _asyncio.run(res)
 
+def record_phase_metrics(log_file, **metrics):
+    """
+    Añade métricas (p. ej. peak_rss_mb) al JSON de la fase desde la propia tarea, que
+    corre en el proceso hijo. PhaseTask las conserva al guardar el estado final.
+    """
+    log_file = Path(log_file)
+    data = json.loads(log_file.read_text()) if log_file.exists() else {}
+    data.setdefault("metrics", {}).update(metrics)
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    log_file.write_text(json.dumps(data))
+
 class PhaseTask:
     def __init__(self, name: str, fn, args: tuple, work_dir: Path):
         self.name     = name
@@ -33,6 +44,8 @@ class PhaseTask:
         self.status   = PhaseStatus.PENDING
         self.log_file = work_dir / f"{name}.json"
         self._proc    = None
+        # Opcional: completa los argumentos justo al arrancar la fase (args -> args)
+        self.prepare_args = None
 
     def _save_state(self):
         data = {
@@ -40,6 +53,15 @@ class PhaseTask:
             "status": self.status.value,
             "timestamp": time.time()
         }
+        # Las métricas de la ejecución en curso las escribe la tarea (record_phase_metrics);
+        # al arrancar de nuevo se descartan las de la ejecución anterior
+        if self.status != PhaseStatus.RUNNING and self.log_file.exists():
+            try:
+                metrics = json.loads(self.log_file.read_text()).get("metrics")
+            except ValueError:
+                metrics = None
+            if metrics:
+                data["metrics"] = metrics
         self.log_file.parent.mkdir(parents=True, exist_ok=True)
         self.log_file.write_text(json.dumps(data))
 
@@ -63,7 +85,8 @@ class PhaseTask:
         self._save_state()
 
         # Levanta proceso usando función de módulo
-        self._proc = Process(target=_run_phase, args=(self.fn, self.args))
+        args = self.prepare_args(self.args) if self.prepare_args else self.args
+        self._proc = Process(target=_run_phase, args=(self.fn, args))
         self._proc.start()
 
         try:
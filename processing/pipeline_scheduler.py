@@ -20,6 +20,10 @@ def _worker(pid: str, info: dict):
     """
     try:
         pm = store.PIPELINE_STORE[pid]
+        if settings.move_batch_size > 1 and 'analisis_movimiento' in pm.phases:
+            # GGIR por lotes: al arrancar, la fase de movimiento recibe los pacientes que
+            # estén en cola en ese momento (la fase corre en otro proceso y no ve store)
+            pm.phases['analisis_movimiento'].prepare_args = lambda args: (dict(args[0], batch=_queued_move_sessions()),)
         # Ejecuta el pipeline (puede ser completo o fase individual)
         asyncio.run(pm.run())
     finally:
@@ -38,6 +42,25 @@ def _worker(pid: str, info: dict):
             schedule_pipeline(next_pid, next_info)
 
 
+def _queued_move_sessions():
+    """
+    (id, fecha) de los pacientes en cola cuyo pipeline va a ejecutar analisis_movimiento,
+    es decir, con esa fase todavía sin completar (una entrada para continuar otra fase,
+    p. ej. create_report, ya la tiene en SUCCESS y no se toca).
+    """
+    queued = []
+    with _lock:
+        for queued_pid, queued_info in store.PIPELINE_QUEUE:
+            queued_pm = store.PIPELINE_STORE.get(queued_pid)
+            move_phase = queued_pm.phases.get('analisis_movimiento') if queued_pm else None
+            if move_phase is None:
+                continue
+            move_phase.load_state()
+            if move_phase.status != PhaseStatus.SUCCESS:
+                queued.append((queued_pid, queued_info['patientDate']))
+    return queued
+
+
 def schedule_pipeline(pid: str, info: dict) -> str:
     """
     Encola o ejecuta inmediatamente el pipeline para el paciente `pid`.
@@ -0,0 +1,148 @@
+# segment_catalog.py
+"""
+Catálogo de los segmentos del árbol de carpetas de 02_seg
+(YYYY.MM.DD/HH/{dato}_{MM}.csv).
+
+El árbol se recorre una vez y el resultado se guarda en 02_seg/segment_catalog.json
+junto con el mtime de cada carpeta de día y de hora: crear un fichero o una carpeta
+cambia el mtime de la carpeta que lo contiene, así que mientras coincidan (y la lista
+de días sea la misma) el catálogo vale y las tareas de análisis no vuelven a recorrer
+las carpetas. Las subcarpetas 02_seg/{W}min (otras duraciones) tienen su propio
+catálogo: SegmentCatalog(os.path.join(seg_dir, '1min')).
+
+El almacén de segmentos (segment_store) tiene su propio índice y no pasa por aquí.
+"""
+import json
+import os
+import re
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from processing.segment_store import REPEATED_HOUR_SUFFIX
+
+SEGMENT_CATALOG_NAME = 'segment_catalog.json'
+SEGMENT_FILE = re.compile(r'^(?P<signal>[a-z]+)_(?P<minute>\d{2})\.csv$')
+DAY_FORMAT = '%Y.%m.%d'
+# Una carpeta modificada hace menos de esto puede seguir cambiando dentro del mismo
+# tick de mtime (segmentación en curso): el catálogo se usa pero no se guarda
+CATALOG_SETTLE_SECONDS = 2
+
+class SegmentFile(namedtuple('SegmentFile', ['day', 'hour', 'minute', 'signal', 'path'])):
+    """
+    Un fichero de segmento: día ('YYYY.MM.DD'), carpeta de hora ('HH' o 'HH_2' en la
+    hora repetida al retrasar el reloj), minuto ('MM'), señal y ruta completa.
+    """
+    __slots__ = ()
+
+    @property
+    def start(self):
+        # Inicio del segmento (hora local, fold=1 en la hora repetida)
+        hour = self.hour[:2]
+        fold = int(self.hour.endswith(REPEATED_HOUR_SUFFIX))
+        return datetime.strptime(f'{self.day} {hour}:{self.minute}', f'{DAY_FORMAT} %H:%M').replace(fold=fold)
+
+def segment_catalog_path(seg_dir):
+    return os.path.join(seg_dir, SEGMENT_CATALOG_NAME)
+
+def is_day_dir(seg_dir, name):
+    # Carpetas YYYY.MM.DD (no las de otras duraciones ni los ficheros del almacén o del catálogo)
+    if not os.path.isdir(os.path.join(seg_dir, name)):
+        return False
+    try:
+        datetime.strptime(name, DAY_FORMAT)
+    except ValueError:
+        return False
+    return True
+
+class SegmentCatalog:
+    """
+    Segmentos de `seg_dir` (02_seg). segments() los devuelve de uno en uno
+    (SegmentFile) en orden de día, hora, minuto y señal, con filtros opcionales
+    por señal y por rango [start, end) del inicio del segmento.
+    """
+    def __init__(self, seg_dir):
+        self.seg_dir = seg_dir
+        self._files = None
+
+    def segments(self, signals=None, start=None, end=None):
+        if isinstance(signals, str):
+            signals = (signals,)
+        for day, hour, minute, signal in self.files():
+            if signals is not None and signal not in signals:
+                continue
+            item = SegmentFile(day, hour, minute, signal,
+                               os.path.join(self.seg_dir, day, hour, f'{signal}_{minute}.csv'))
+            if start is not None or end is not None:
+                segStart = item.start
+                if (start is not None and segStart < start) or (end is not None and segStart >= end):
+                    continue
+            yield item
+
+    def files(self):
+        # (día, hora, minuto, señal) de todos los ficheros, del catálogo guardado si sigue valiendo
+        if self._files is None:
+            days = self._days()
+            cached = self._load()
+            if cached is not None and self._valid(cached, days):
+                self._files = [tuple(item) for item in cached['files']]
+            else:
+                self._files = self._scan(days)
+        return self._files
+
+    def refresh(self):
+        # Olvida lo leído: la siguiente consulta vuelve a comprobar las carpetas
+        self._files = None
+
+    def _days(self):
+        if not os.path.isdir(self.seg_dir):
+            return []
+        return sorted(name for name in os.listdir(self.seg_dir) if is_day_dir(self.seg_dir, name))
+
+    def _load(self):
+        try:
+            with open(segment_catalog_path(self.seg_dir), 'r', encoding='utf-8') as catalogFile:
+                return json.load(catalogFile)
+        except (OSError, ValueError):
+            return None
+
+    def _valid(self, cached, days):
+        if sorted(cached.get('days', [])) != days:
+            return False
+        for folder, mtime in cached.get('mtimes', {}).items():
+            try:
+                if os.stat(os.path.join(self.seg_dir, folder)).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _scan(self, days):
+        files = []
+        mtimes = {}
+        for day in days:
+            dayDir = os.path.join(self.seg_dir, day)
+            mtimes[day] = os.stat(dayDir).st_mtime_ns
+            for hour in sorted(os.listdir(dayDir)):
+                hourDir = os.path.join(dayDir, hour)
+                if not os.path.isdir(hourDir):
+                    continue
+                mtimes[os.path.join(day, hour)] = os.stat(hourDir).st_mtime_ns
+                for name in os.listdir(hourDir):
+                    match = SEGMENT_FILE.match(name)
+                    if match:
+                        files.append((day, hour, match['minute'], match['signal']))
+        files.sort()
+        if days and max(mtimes.values()) < (time.time() - CATALOG_SETTLE_SECONDS) * 1e9:
+            self._save({'days': days, 'mtimes': mtimes, 'files': files})
+        return files
+
+    def _save(self, catalog):
+        # Escritura atómica; si 02_seg no se puede escribir el catálogo simplemente no se guarda
+        path = segment_catalog_path(self.seg_dir)
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as catalogFile:
+                json.dump(catalog, catalogFile)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
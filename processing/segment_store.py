@@ -0,0 +1,221 @@
+# segment_store.py
+"""
+Almacén de segmentos de 02_seg en un solo fichero por señal.
+
+En lugar de 02_seg/YYYY.MM.DD/HH/{dato}_{MM}.csv (unos 6.000 ficheros por semana),
+cada señal (movimiento, temperatura, hr) va a un Parquet con todas sus filas en orden
+y 02_seg/segment_index.json guarda, para cada segmento de 5 minutos, su inicio, su fin
+y el tramo de filas (offset, filas) de cada señal. Cualquier ventana se lee por offset
+sin recorrer carpetas.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+SEGMENT_INDEX_NAME = 'segment_index.json'
+# Filas por row group de los Parquet (la lectura por offset solo descomprime los que toca)
+STORE_ROW_GROUP_ROWS = 1 << 18
+START_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Carpeta de la hora que se repite al retrasar el reloj (segunda pasada, fold=1): HH_2
+REPEATED_HOUR_SUFFIX = '_2'
+
+# Tipo de cada columna en el almacén y formato con el que vuelve al CSV
+INTEGER_COLUMNS = ('dateTime', 'hr_raw', 'hr')
+FIXED_DECIMAL_COLUMNS = ('acc_x', 'acc_y', 'acc_z', 'gyr_x', 'gyr_y', 'gyr_z')
+
+def hour_folder(start):
+    # Nombre de la carpeta de hora de un segmento que empieza en `start` (hora local)
+    return f'{start.hour:02d}' + (REPEATED_HOUR_SUFFIX if start.fold else '')
+
+def segment_index_path(seg_dir):
+    return os.path.join(seg_dir, SEGMENT_INDEX_NAME)
+
+def has_segment_store(seg_dir):
+    return os.path.exists(segment_index_path(seg_dir))
+
+def column_to_arrow(name, values):
+    # Cadenas del CSV ('' = sin muestra) o valores ya convertidos -> array de Arrow con nulos
+    import pyarrow as pa
+    try:
+        numeric = pd.to_numeric(pd.Series(values, dtype=object))
+    except ValueError as e:
+        # dateTime en texto (no en milisegundos) no se puede guardar en el almacén
+        raise ValueError(f"Columna {name} no numérica en el almacén de segmentos: {e}") from e
+    if name in INTEGER_COLUMNS:
+        mask = numeric.isna().to_numpy()
+        return pa.array(numeric.fillna(0).to_numpy().astype(np.int64), pa.int64(), mask=mask)
+    return pa.array(numeric.to_numpy(dtype=np.float64), pa.float64(), from_pandas=True)
+
+def signal_schema(names):
+    import pyarrow as pa
+    return pa.schema([(name, pa.int64() if name in INTEGER_COLUMNS else pa.float64()) for name in names])
+
+def format_column(name, values):
+    # Texto de cada celda tal como lo escribe bin2csv en el CSV de 01_raw
+    if name in INTEGER_COLUMNS:
+        return ['' if value is None else str(value) for value in values.to_pylist()]
+    if name in FIXED_DECIMAL_COLUMNS:
+        return ['' if value is None else '%.8f' % value for value in values.to_pylist()]
+    return ['' if value is None else repr(value) for value in values.to_pylist()]
+
+class SegmentStoreWriter:
+    """
+    Escribe los segmentos en el almacén de `seg_dir` (02_seg). `columns` indica,
+    por señal, las columnas y su orden. Cada llamada a write_segment añade las filas
+    de una señal de un segmento y su entrada en el índice. Las filas se guardan en
+    memoria hasta completar un row group de `row_group_rows` filas.
+    """
+    def __init__(self, seg_dir, columns, minutes=5, row_group_rows=STORE_ROW_GROUP_ROWS):
+        self.seg_dir = seg_dir
+        self.columns = columns
+        self.minutes = minutes
+        self.rowGroupRows = row_group_rows
+        self._writers = {}
+        self._pending = {dato: [] for dato in columns}
+        self._pendingRows = {dato: 0 for dato in columns}
+        self._rows = {dato: 0 for dato in columns}
+        self._segments = []
+        os.makedirs(seg_dir, exist_ok=True)
+        # Un índice a medias no debe quedar como válido si la segmentación se interrumpe
+        if has_segment_store(seg_dir):
+            os.remove(segment_index_path(seg_dir))
+
+    def write_segment(self, start, dato, pieces):
+        """
+        Añade las filas del segmento que empieza en `start` (datetime local) para la
+        señal `dato`. `pieces` es una lista de trozos, cada uno con un array por columna.
+        """
+        if (not self._segments or self._segments[-1]['start'] != start.strftime(START_FORMAT)
+                or self._segments[-1].get('fold', 0) != start.fold):
+            entry = {
+                'start': start.strftime(START_FORMAT),
+                'end': (start + timedelta(minutes=self.minutes)).strftime(START_FORMAT),
+                'signals': {},
+            }
+            if start.fold:
+                # Segunda pasada de la hora repetida al retrasar el reloj
+                entry['fold'] = 1
+            self._segments.append(entry)
+        rows = sum(len(piece[0]) for piece in pieces)
+        self._segments[-1]['signals'][dato] = [self._rows[dato], rows]
+        self._rows[dato] += rows
+        self._pending[dato].extend(pieces)
+        self._pendingRows[dato] += rows
+        if self._pendingRows[dato] >= self.rowGroupRows:
+            self._flush(dato)
+
+    def _flush(self, dato):
+        if not self._pending[dato]:
+            return
+        import pyarrow as pa
+        names = self.columns[dato]
+        arrays = [column_to_arrow(name, np.concatenate([piece[k] for piece in self._pending[dato]]))
+                  for k, name in enumerate(names)]
+        table = pa.Table.from_arrays(arrays, schema=signal_schema(names))
+        self._writer(dato).write_table(table, row_group_size=self.rowGroupRows)
+        self._pending[dato] = []
+        self._pendingRows[dato] = 0
+
+    def _writer(self, dato):
+        if dato not in self._writers:
+            import pyarrow.parquet as pq
+            self._writers[dato] = pq.ParquetWriter(os.path.join(self.seg_dir, f'{dato}.parquet'),
+                                                   signal_schema(self.columns[dato]), compression='zstd')
+        return self._writers[dato]
+
+    def close(self):
+        for dato in self.columns:
+            self._flush(dato)
+            # Todas las señales tienen su fichero, aunque no tengan filas
+            self._writer(dato).close()
+        index = {
+            'minutes': self.minutes,
+            'signals': {dato: {'file': f'{dato}.parquet', 'columns': list(names), 'rows': self._rows[dato]}
+                        for dato, names in self.columns.items()},
+            'segments': self._segments,
+        }
+        with open(segment_index_path(self.seg_dir), 'w', encoding='utf-8') as indexFile:
+            json.dump(index, indexFile)
+
+class SegmentStore:
+    """
+    Lectura del almacén de segmentos de `seg_dir` (02_seg).
+    segments() devuelve las entradas del índice; read(entry, dato) las filas de una
+    señal de un segmento como DataFrame (nulos como NaN), leyendo solo los row groups
+    que contienen ese tramo.
+    """
+    def __init__(self, seg_dir):
+        self.seg_dir = seg_dir
+        with open(segment_index_path(seg_dir), 'r', encoding='utf-8') as indexFile:
+            self.index = json.load(indexFile)
+        self._files = {}
+        self._cache = {}
+
+    def segments(self):
+        """
+        Segmentos por orden de escritura. Igual que en el árbol de carpetas, si dos
+        segmentos empiezan a la misma hora (saltos atrás del reloj) queda el último; la
+        hora repetida al retrasar el reloj (fold) es otra carpeta y no cuenta como repetida.
+        """
+        latest = {}
+        for entry in self.index['segments']:
+            for dato, rows in entry['signals'].items():
+                latest[(entry['start'], entry.get('fold', 0), dato)] = (entry, rows)
+        result = []
+        for entry in self.index['segments']:
+            signals = {dato: rows for dato, rows in entry['signals'].items()
+                       if latest[(entry['start'], entry.get('fold', 0), dato)][1] is rows}
+            if signals:
+                result.append(dict(entry, signals=signals))
+        return result
+
+    @staticmethod
+    def start_of(entry):
+        return datetime.strptime(entry['start'], START_FORMAT).replace(fold=entry.get('fold', 0))
+
+    def _parquet(self, dato):
+        if dato not in self._files:
+            import pyarrow.parquet as pq
+            parquetFile = pq.ParquetFile(os.path.join(self.seg_dir, self.index['signals'][dato]['file']))
+            metadata = parquetFile.metadata
+            offsets = np.cumsum([0] + [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+            self._files[dato] = (parquetFile, offsets)
+        return self._files[dato]
+
+    def _row_group(self, dato, group):
+        # El último row group leído de cada señal se conserva: los segmentos se leen en orden
+        key = (dato, group)
+        if key not in self._cache:
+            self._cache = {k: v for k, v in self._cache.items() if k[0] != dato}
+            self._cache[key] = self._parquet(dato)[0].read_row_group(group)
+        return self._cache[key]
+
+    def read_table(self, entry, dato):
+        import pyarrow as pa
+        offset, rows = entry['signals'][dato]
+        parquetFile, offsets = self._parquet(dato)
+        if rows == 0:
+            return parquetFile.schema_arrow.empty_table()
+        tables = []
+        group = int(np.searchsorted(offsets, offset, side='right')) - 1
+        end = offset + rows
+        while offset < end:
+            table = self._row_group(dato, group)
+            first = offset - offsets[group]
+            take = min(end, offsets[group + 1]) - offset
+            tables.append(table.slice(first, take))
+            offset += take
+            group += 1
+        return pa.concat_tables(tables)
+
+    def column(self, dato, name):
+        # Columna completa de una señal (ChunkedArray); se corta por los offsets del índice
+        import pyarrow.parquet as pq
+        return pq.read_table(os.path.join(self.seg_dir, self.index['signals'][dato]['file']),
+                             columns=[name]).column(name)
+
+    def read(self, entry, dato):
+        return self.read_table(entry, dato).to_pandas()
@@ -0,0 +1,221 @@
+# step_counter.py
+"""
+Contador de pasos de Verisense (Gu et al., 2017) en NumPy, equivalente a
+verisense_count_steps de analisis_movimiento.R (el `myfun` de GGIR), para tener los
+pasos de una sesión en segundos directamente desde el 01_raw, sin esperar a GGIR.
+
+verisense_count_steps reproduce la función de R paso a paso, incluidas sus
+particularidades (la fila NA que deja el filtro de periodicidad y que descarta los dos
+últimos picos en la similitud, la longitud de la salida cuando no hay pasos...), así
+que sobre la misma señal a 15 Hz devuelve los mismos pasos por segundo.
+pruebas/paridad_pasos.py lo compara con la función de R.
+
+Los totales diarios se parecen a los de GGIR pero no tienen por qué coincidir: GGIR
+llama a la función por bloques de datos (los picos en los bordes de bloque cambian) y
+agrega los minutos según sus propias épocas.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from processing.tasks.csvprocess_task import read_raw_chunks, normalize_timestamps, segment_timezone, MINUTE_US
+
+# Parámetros de ggir_step_counter (Rowlands et al.): k, period_min, period_max, sim_thres,
+# cont_win_size, cont_thres, var_thres, mag_thres
+STEP_COEFFS = (4, 4, 20, -1.0, 4, 4, 0.01, 1.25)
+STEP_SAMPLE_RATE = 15
+# Bandas de cadencia (pasos por minuto) de resultado_estructurado.json
+CADENCE_BANDS = (('step_count_1_39spm', 1, 39), ('step_count_40_99spm', 40, 99), ('step_count_100spm+', 100, None))
+DAY_US = 24 * 60 * MINUTE_US
+
+def verisense_count_steps(input_data, coeffs=STEP_COEFFS, fs=STEP_SAMPLE_RATE):
+    """
+    Pasos por segundo de una señal de aceleración (n x 3, en g, a `fs` Hz y sin huecos).
+    """
+    data = np.asarray(input_data, dtype=np.float64)
+    acc = np.sqrt(data[:, 0] ** 2 + data[:, 1] ** 2 + data[:, 2] ** 2)
+    n = len(acc)
+    noSteps = np.zeros(int(round(n / fs)))
+    if n < 2 or np.std(acc, ddof=1) < 0.025:
+        # acceleration too low, no steps
+        return noSteps
+
+    k, period_min, period_max, sim_thres, cont_win_size, cont_thres, var_thres, mag_thres = coeffs
+    k, cont_win_size, cont_thres = int(k), int(cont_win_size), int(cont_thres)
+    half_k = int(round(k / 2))
+    segments = n // k
+    if segments == 0:
+        return noSteps
+
+    # Máximo de cada tramo de k muestras (el primero, como which.max)...
+    loc = np.arange(segments) * k + np.argmax(acc[:segments * k].reshape(segments, k), axis=1)
+    # ...que solo es pico si también es el primer máximo de [loc - k/2, loc + k/2]. En R la
+    # ventana se recorta en los bordes y se comprueba la posición k/2 + 1 desde su inicio
+    isPeak = np.ones(segments, dtype=bool)
+    for offset in range(1, half_k + 1):
+        before = loc - offset
+        isPeak &= (before < 0) | (acc[loc] > acc[np.maximum(before, 0)])
+        after = loc + offset
+        isPeak &= (after >= n) | (acc[loc] >= acc[np.minimum(after, n - 1)])
+    for i in np.flatnonzero(loc < half_k):
+        window = acc[:min(loc[i] + half_k, n - 1) + 1]
+        isPeak[i] = np.argmax(window) == half_k
+    loc = loc[isPeak]
+    mag = acc[loc]
+
+    # filter based on mag_thres
+    keep = mag > mag_thres
+    loc, mag = loc[keep], mag[keep]
+    if len(loc) <= 2:  # there must be at least two steps
+        return noSteps
+
+    # Periodicidad con el pico siguiente (antes de filtrar). El último pico no tiene y en R
+    # queda como fila NA al final: cuenta para la similitud pero no es un pico
+    period = np.diff(loc)
+    keep = (period > period_min) & (period < period_max)
+    loc, mag = loc[:-1][keep], mag[:-1][keep]
+    if len(loc) < 2:
+        # Solo la fila NA (con un pico y la fila NA, la función de R falla)
+        return noSteps
+
+    # Similitud con el pico dos posiciones más allá; los dos últimos la tienen NA (la fila NA)
+    similarity = -np.abs(mag[2:] - mag[:-2])
+    keep = similarity > sim_thres
+    loc = loc[:-2][keep]
+
+    # Continuidad: de los cont_thres periodos anteriores, al menos cont_win_size con
+    # varianza de la aceleración por encima de var_thres. Solo se evalúan las filas
+    # cont_thres..n-1 (en R), el resto se descartan
+    if len(loc) <= 5:
+        return noSteps
+    overThres = (window_variances(acc, loc) > var_thres).astype(np.int64)
+    counts = np.convolve(overThres, np.ones(cont_thres, dtype=np.int64), mode='valid')
+    rows = np.arange(cont_thres - 1, len(loc) - 1)
+    steps = loc[rows[counts[:len(rows)] >= cont_win_size]]
+    if len(steps) == 0:
+        return noSteps
+
+    # for GGIR, output the number of steps in 1 second chunks
+    return np.bincount(steps // fs, minlength=-(-n // fs)).astype(np.float64)
+
+def window_variances(acc, loc):
+    """
+    Varianza muestral de acc[loc[j]:loc[j + 1] + 1] (ambos picos incluidos, como
+    acc[a:b] en R) para cada par de picos consecutivos, en dos pasadas como var().
+    """
+    lengths = np.diff(loc)
+    starts = loc[:-1] - loc[0]
+    span = acc[loc[0]:loc[-1]]
+    ends = acc[loc[1:]]
+    means = (np.add.reduceat(span, starts) + ends) / (lengths + 1)
+    deviations = span - np.repeat(means, lengths)
+    squares = np.add.reduceat(deviations ** 2, starts) + (ends - means) ** 2
+    return squares / lengths
+
+def resample_acc(utc_us, acc, fs=STEP_SAMPLE_RATE, start_us=None):
+    """
+    Interpolación lineal de acc (n x 3) a `fs` Hz (como hace GGIR antes de llamar a
+    myfun) sobre la rejilla start_us + i / fs segundos. Devuelve (índice de la primera
+    muestra de la rejilla, muestras) con las muestras dentro de [utc_us[0], utc_us[-1]].
+    """
+    start_us = utc_us[0] if start_us is None else start_us
+    period_us = 1000000 / fs
+    first = int(np.ceil((utc_us[0] - start_us) / period_us))
+    last = int(np.floor((utc_us[-1] - start_us) / period_us))
+    if last < first:
+        return first, np.empty((0, 3))
+    grid = start_us + np.arange(first, last + 1) * period_us
+    return first, np.column_stack([np.interp(grid, utc_us, acc[:, axis]) for axis in range(3)])
+
+def raw_file_acc(raw_file, fs=STEP_SAMPLE_RATE, timezone=None):
+    """
+    Acelerómetro del fichero de 01_raw (CSV/Parquet/Feather) remuestreado a `fs` Hz, leído
+    por bloques. Devuelve (instante UTC de la primera muestra en microsegundos, muestras).
+    `timezone` es la de las fechas en texto del 01_raw, si las hay.
+    """
+    start_us = None
+    parts = []
+    carry = None
+    expected = 0
+    for columns in read_raw_chunks(raw_file):
+        present = columns['acc_x'] != ''
+        if not present.any():
+            continue
+        _, utc, _ = normalize_timestamps(columns['dateTime'][present], timezone)
+        acc = np.column_stack([columns[name][present].astype(np.float64) for name in ('acc_x', 'acc_y', 'acc_z')])
+        if carry is not None:
+            # La última muestra del bloque anterior une los dos bloques en la interpolación
+            utc = np.concatenate([carry[0], utc])
+            acc = np.concatenate([carry[1], acc])
+        elif start_us is None:
+            start_us = int(utc[0])
+        first, samples = resample_acc(utc, acc, fs, start_us)
+        # Las muestras de la rejilla en el borde entre bloques ya salieron en el anterior
+        parts.append(samples[max(expected - first, 0):])
+        expected = max(expected, first + len(samples))
+        carry = (utc[-1:], acc[-1:])
+    if start_us is None:
+        return None, np.empty((0, 3))
+    return start_us, np.concatenate(parts)
+
+def cadence_summary(steps_per_minute):
+    # Pasos totales y por bandas de cadencia, con los nombres de resultado_estructurado.json
+    steps_per_minute = np.asarray(steps_per_minute)
+    summary = {'step_count_total': float(steps_per_minute.sum())}
+    for name, low, high in CADENCE_BANDS:
+        inBand = (steps_per_minute >= low) & ((steps_per_minute <= high) if high is not None else True)
+        summary[name] = float(steps_per_minute[inBand].sum())
+    return summary
+
+def daily_steps(start_us, steps_per_sec, timezone=None):
+    """
+    Pasos por día natural (hora local de `timezone`, nombre IANA; None = la del sistema)
+    con las bandas de cadencia de cada minuto de reloj, como steps_summary en
+    analisis_movimiento.R.
+    """
+    timezone = segment_timezone(timezone)
+    seconds = start_us + np.arange(len(steps_per_sec), dtype=np.int64) * 1000000
+    local, _, _ = normalize_timestamps(seconds // 1000, timezone)
+    minutes = pd.Series(steps_per_sec).groupby(local // MINUTE_US).sum()
+    days = (minutes.index.to_numpy() * MINUTE_US) // DAY_US
+    rows = []
+    for day, dayMinutes in minutes.groupby(days):
+        date = (pd.Timestamp(0) + pd.Timedelta(days=int(day))).strftime('%Y-%m-%d')
+        rows.append(dict(calendar_date=date, **cadence_summary(dayMinutes.to_numpy())))
+    return pd.DataFrame(rows, columns=['calendar_date', 'step_count_total'] + [name for name, _, _ in CADENCE_BANDS])
+
+def raw_file_steps(raw_file, timezone=None, coeffs=STEP_COEFFS):
+    # Pasos por día de un fichero de 01_raw
+    start_us, acc = raw_file_acc(raw_file, STEP_SAMPLE_RATE, segment_timezone(timezone))
+    if start_us is None:
+        return daily_steps(0, np.zeros(0), timezone)
+    return daily_steps(start_us, verisense_count_steps(acc, coeffs, STEP_SAMPLE_RATE), timezone)
+
+def main(argv=None):
+    """
+    Pasos por día de un 01_raw sin pasar por GGIR:
+        python -m processing.step_counter Datos_pacientes/<id>/<sesión>/01_raw/<sesión>.feather
+    """
+    parser = argparse.ArgumentParser(description='Cuenta los pasos (Verisense) de un fichero de 01_raw.')
+    parser.add_argument('raw_file', help='fichero de 01_raw (CSV, Parquet o Feather)')
+    parser.add_argument('-o', '--output', help='CSV de salida con los pasos por día')
+    parser.add_argument('--timezone', default='', help='zona IANA para los días (por defecto, la del sistema)')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.raw_file):
+        print('step_counter: ' + args.raw_file + ': No such file or directory')
+        return 1
+    startTime = time.time()
+    steps = raw_file_steps(args.raw_file, args.timezone or None)
+    print(steps.to_string(index=False))
+    print(f'({time.time() - startTime:.1f} s)')
+    if args.output:
+        steps.to_csv(args.output, index=False)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
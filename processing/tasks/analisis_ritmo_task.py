@@ -1,14 +1,29 @@
+import json
 import os
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from processing.segment_store import SegmentStore, has_segment_store, hour_folder
+from processing.segment_catalog import SegmentCatalog
+from processing.hr_summary import write_hr_summaries
+
+# Ficheros hr_* que lee cada tarea del pool
+RHYTHM_CHUNK_FILES = 64
+# Marca de 03_bio: HR_seg/HR_day calculados durante la segmentación
+RHYTHM_STREAM_NAME = 'hr_stream.json'
 
 def rhythm_analysis(dir_path):
     global bio_status
     get_rhythm(dir_path)
     bio_status = "OK"
 
-def get_rhythm(dir_path):
-    results = pd.DataFrame()
+def get_rhythm(dir_path, workers=1):
+    """
+    Estadísticas de frecuencia cardiaca por segmento (HR_seg.csv) y sus resúmenes
+    por día, hora y día de la semana (HR_day.csv, HR_hour.csv, HR_weekday.csv) en 03_bio.
+    Con `workers` > 1 los hr_* de 02_seg se leen en varios procesos (0 = todos los
+    núcleos); las estadísticas se calculan en una sola agregación.
+    """
     lista_res = []
     if os.path.exists(dir_path):
 
@@ -23,57 +38,137 @@ def get_rhythm(dir_path):
 
             dirname = os.path.join(dir_path, "02_seg")
 
-            for day in os.listdir(dirname):
-                dir_day = os.path.join(dirname,day)
-                if os.path.isdir(dir_day):
-                    d2 = os.listdir(dir_day)
-
-                    for hour in d2:
-                        dir_hour = os.path.join(dir_day, hour)
-
-                        d3 = os.listdir(dir_hour)
+            if has_segment_store(dirname):
+                keys, heart_rates = store_heart_rates(dirname)
+            else:
+                keys, heart_rates = folder_heart_rates(dirname, workers)
 
-                        for seg in d3:
-                            if seg[0:2] == "hr":
-                                # if seg[-6:-4] == "_":
-                                #     seg = seg[:-6] + "0" + seg[-6:]
-                                dir_seg = os.path.join(dir_hour, seg)
-                                print(dir_seg)
+            for (day, hour, seg), stats in zip(keys, segment_hr_stats(heart_rates)):
+                res = [day+""+hour+""+seg[:-4],day, f'{hour}:{seg[3:]}', *stats]
+                lista_res.append(res)
 
-                                Media, STD, Maximo, Minimo = mata_processing(dir_seg)
-
-                                res = [day+""+hour+""+seg[:-4],day, f'{hour}:{seg[3:]}', Media, STD, Maximo, Minimo]
-                                lista_res.append(res)
-
-        try:
-            os.mkdir(os.path.join(dir_path, "03_bio"))
-            with open(os.path.join(os.mkdir(os.path.join(dir_path, "03_bio")), 'bio_status.txt'), 'w') as bioStatusFile:
-                            bioStatusFile.write("Started") # Actualiza el estado en el archivo de seguimiento de estado
-        except:
-            print("Carpeta existente")
-         
-        
-        results = pd.DataFrame(lista_res, columns=['Segmento', "Fecha",  'Hora','Media', 'STD', 'Maximo', 'Minimo'])
-        results.index = results.Segmento
-        results = results.drop('Segmento', axis =1)
-        results.to_csv(os.path.join(dir_path, "03_bio","HR_seg.csv"))
-
-        results2 = pd.DataFrame()
-        for dia in results.Fecha.unique():
-            df_aux = results[results.Fecha == dia]
-            d_aux = {'Fecha':[dia], 'Media': [np.round(np.nanmean(df_aux.Media),2)], 'STD': [np.round(np.nanstd(df_aux.STD),3)], 'Maximo': [np.nanmax(df_aux.Maximo)], 'Minimo': [np.nanmin(df_aux.Minimo)]}
-            results2 = pd.concat([results2, pd.DataFrame(d_aux)])
-
-        results2.to_csv(os.path.join(dir_path, "03_bio","HR_day.csv"))
+        write_rhythm_results(dir_path, lista_res)
 
     else:
         print("DIR DOES NOT EXIST")
 
+def write_rhythm_results(dir_path, lista_res):
+    # HR_seg.csv (una fila por segmento, con N, Suma y SumaCuadrados de las muestras con
+    # hr>0) y sus resúmenes en 03_bio. Media y STD se redondean solo al guardar
+    try:
+        os.mkdir(os.path.join(dir_path, "03_bio"))
+        with open(os.path.join(os.mkdir(os.path.join(dir_path, "03_bio")), 'bio_status.txt'), 'w') as bioStatusFile:
+                        bioStatusFile.write("Started") # Actualiza el estado en el archivo de seguimiento de estado
+    except:
+        print("Carpeta existente")
+     
+    
+    results = pd.DataFrame(lista_res, columns=['Segmento', "Fecha",  'Hora','Media', 'STD', 'Maximo', 'Minimo', 'N',
+                                               'Suma', 'SumaCuadrados'])
+    results.index = results.Segmento
+    results = results.drop('Segmento', axis =1)
+    results.round({'Media': 2, 'STD': 3}).to_csv(os.path.join(dir_path, "03_bio","HR_seg.csv"))
+
+    write_hr_summaries(dir_path, results)
+
+def folder_heart_rates(dirname, workers=1):
+    # (día, hora, fichero) y columna hr de cada hr_* del árbol de carpetas de 02_seg
+    keys = []
+    paths = []
+    for item in SegmentCatalog(dirname).segments(signals='hr'):
+        keys.append((item.day, item.hour, os.path.basename(item.path)))
+        paths.append(item.path)
+
+    if not workers:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(paths) > RHYTHM_CHUNK_FILES:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            heart_rates = list(executor.map(read_hr_file, paths, chunksize=RHYTHM_CHUNK_FILES))
+    else:
+        heart_rates = [read_hr_file(path) for path in paths]
+    return keys, heart_rates
+
+def store_heart_rates(dirname):
+    # Lo mismo desde el almacén de segmentos: la columna hr se lee una vez y se corta por offsets
+    keys = []
+    heart_rates = []
+    store = SegmentStore(dirname)
+    column = store.column('hr', 'hr')
+    for entry in sorted(store.segments(), key=lambda entry: entry['start']):
+        if 'hr' not in entry['signals']:
+            continue
+        start = store.start_of(entry)
+        offset, rows = entry['signals']['hr']
+        keys.append((start.strftime('%Y.%m.%d'), hour_folder(start), f'hr_{start.minute:02d}.csv'))
+        heart_rates.append(column.slice(offset, rows).to_numpy())
+    return keys, heart_rates
+
+def hr_values(values):
+    # Valores de hr como cadenas ('' = sin muestra) -> mismo tipo que daría pd.read_csv
+    # (int64, o float64 con NaN si hay celdas vacías)
+    try:
+        return np.array(values, dtype=np.int64)
+    except ValueError:
+        return np.array([float(value) if value else np.nan for value in values])
+
+def read_hr_file(dir_seg):
+    # Los hr_* de la segmentación no llevan comillas: la columna hr se corta directamente,
+    # con el mismo tipo que daría pd.read_csv (int64, o float64 si hay celdas vacías)
+    with open(dir_seg, 'r', encoding='utf-8') as segFile:
+        text = segFile.read()
+    lines = text.split()
+    if '"' not in text and lines and 'hr' in lines[0].split(','):
+        column = lines[0].split(',').index('hr')
+        try:
+            return hr_values([line.split(',')[column] for line in lines[1:]])
+        except (ValueError, IndexError):
+            pass
+    heart_rate = pd.read_csv(dir_seg, usecols=['hr']).hr
+    if heart_rate.empty:
+        return np.empty(0, dtype=np.int64)
+    return heart_rate.to_numpy()
+
+def segment_hr_stats(heart_rates):
+    """
+    Media, STD, Maximo, Minimo, N, Suma y SumaCuadrados de hr>0 de cada segmento (igual
+    que hr_stats) agrupando todas las muestras de una vez; -1 (y N, Suma y SumaCuadrados
+    = 0) en los segmentos sin frecuencia cardiaca.
+    """
+    if not heart_rates:
+        return []
+    segment = np.repeat(np.arange(len(heart_rates)), [len(hr) for hr in heart_rates])
+    data = pd.DataFrame({'segment': segment, 'hr': hr_sum_values(np.concatenate(heart_rates))})
+    data = data[data.hr > 0]
+    data['hr2'] = data.hr ** 2
+    grouped = data.groupby('segment')
+    stats = pd.DataFrame({
+        'Media': grouped.hr.mean(),
+        'STD': grouped.hr.std(ddof=0),
+        'Maximo': grouped.hr.max(),
+        'Minimo': grouped.hr.min(),
+        'N': grouped.size(),
+        'Suma': grouped.hr.sum(),
+        'SumaCuadrados': grouped.hr2.sum(),
+    }).reindex(range(len(heart_rates)), fill_value=-1)
+    for column in ('N', 'Suma', 'SumaCuadrados'):
+        stats[column] = stats[column].clip(lower=0)
+    return list(stats.itertuples(index=False, name=None))
+
+def hr_sum_values(hr):
+    # hr en int64 (o float64 si hay celdas vacías) para que las sumas de cuadrados no desborden
+    hr = np.asarray(hr)
+    return hr.astype(np.int64) if hr.dtype.kind in 'iu' else hr.astype(np.float64)
+
 def mata_processing(dir_seg):
     data = pd.read_csv(dir_seg)
-    heart_rate = data.hr[data.hr>0]
+    Media, STD, Maximo, Minimo = hr_stats(data.hr)[:4]
+    return [np.round(Media,2), np.round(STD,3), Maximo, Minimo]
 
-    if heart_rate.empty:
+def hr_stats(hr):
+    # Media, STD, Maximo, Minimo, N, Suma y SumaCuadrados de hr>0, sin redondear
+    heart_rate = hr_sum_values(hr[hr>0])
+
+    if len(heart_rate) == 0:
         Media = -1
         STD = -1
         Maximo = -1
@@ -84,4 +179,40 @@ def mata_processing(dir_seg):
         Maximo = np.nanmax(heart_rate)
         Minimo = np.nanmin(heart_rate)
 
-    return [np.round(Media,2), np.round(STD,3), Maximo, Minimo]
\ No newline at end of file
+    return [Media, STD, Maximo, Minimo, len(heart_rate), heart_rate.sum(), (heart_rate ** 2).sum()]
+
+class RhythmAccumulator:
+    """
+    Estadísticas de hr de cada segmento según lo escribe la segmentación, para generar
+    HR_seg.csv y sus resúmenes sin volver a leer 02_seg. Cada segmento se reduce al
+    escribirse (igual que mata_processing); si un segmento se reescribe (reloj hacia
+    atrás) queda el último, como su fichero.
+    """
+    def __init__(self, dir_path):
+        self.dir_path = dir_path
+        self.segments = {}
+        clear_rhythm_stream(dir_path)
+
+    def add(self, start, hr):
+        key = (start.strftime('%Y.%m.%d'), hour_folder(start), f'hr_{start.minute:02d}.csv')
+        self.segments[key] = hr_stats(hr_values(hr))
+
+    def write(self):
+        lista_res = []
+        for (day, hour, seg), stats in sorted(self.segments.items()):
+            lista_res.append([day+""+hour+""+seg[:-4],day, f'{hour}:{seg[3:]}', *stats])
+        write_rhythm_results(self.dir_path, lista_res)
+        with open(rhythm_stream_path(self.dir_path), 'w', encoding='utf-8') as streamFile:
+            json.dump({'segments': len(lista_res)}, streamFile)
+
+def rhythm_stream_path(dir_path):
+    return os.path.join(dir_path, "03_bio", RHYTHM_STREAM_NAME)
+
+def clear_rhythm_stream(dir_path):
+    # Al volver a segmentar, el resultado de una segmentación anterior deja de valer
+    if os.path.exists(rhythm_stream_path(dir_path)):
+        os.remove(rhythm_stream_path(dir_path))
+
+def has_streamed_rhythm(dir_path):
+    # HR_seg/HR_day ya generados por la segmentación (la fase bio_analisis no tiene que hacer nada)
+    return os.path.exists(rhythm_stream_path(dir_path)) and os.path.exists(os.path.join(dir_path, "03_bio", "HR_seg.csv"))
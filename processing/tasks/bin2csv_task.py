@@ -9,14 +9,19 @@ import string
 import csv
 import struct
 import binascii
+import json
+import mmap
 import sys
+import argparse
 
 import subprocess
 
-from copy import deepcopy
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, ExitStack
+from functools import lru_cache
 
-from queue import Queue, LifoQueue, PriorityQueue
-import _thread
+import numpy as np
 
 # pip install pyinstaller -i http://mirrors.aliyun.com/pypi/simple/ --trusted-host mirrors.aliyun.com 代理下载pip模块
 
@@ -24,8 +29,6 @@ csvFilePath = ''
 
 csvFileHead = [['dateTime', 'acc_x', 'acc_y', 'acc_z', 'gyr_x', 'gyr_y', 'gyr_z',
                 'bodySurface_temp', 'ambient_temp', 'hr_raw', 'hr', 'remarks']]
-dfCsvFileHeadDict_ = {'dateTime': '', 'acc_x': '', 'acc_y': '', 'acc_z': '', 'gyr_x': '', 'gyr_y': '', 'gyr_z': '',
-                      'bodySurface_temp': '', 'ambient_temp': '', 'hr_raw': '', 'hr': '', 'remarks': ''}
 
 s = struct.Struct('III')
 
@@ -34,12 +37,38 @@ FILE_HEADER_RECOGNITION_STRING = 'MDTC'
 
 PACKAGE_HEARD_KEY = bytes(PACKAGE_HEADER_RECOGNITION_STRING, encoding='utf-8')
 
-QUEUE_ONE_ITERM_BYTE_SIZE = 1024*10
 REMARKES_SIZE = 512
+# Paquetes que decodifica cada tarea en el modo multiproceso
+PARALLEL_CHUNK_PACKAGES = 256
+# Buffer del fichero CSV de salida y filas acumuladas antes de cada escritura
+CSV_WRITE_BUFFER_SIZE = 1 << 20
+CSV_BATCH_ROWS = 1 << 16
+# Cada cuántos paquetes escritos se vuelca el CSV y se actualiza el punto de control
+CHECKPOINT_PACKAGES = 4096
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+# Informe de integridad del BIN (en 00_bin): salto mínimo entre paquetes que se
+# considera hueco de datos y número máximo de incidencias listadas por tipo
+INTEGRITY_REPORT_NAME = 'bin_integrity.json'
+TIME_GAP_SECONDS = 2
+MAX_REPORTED_ISSUES = 100
 
-# 解决鼠标点击命令行窗口程序停止问题
-kernel32 = ctypes.windll.kernel32
-kernel32.SetConsoleMode(kernel32.GetStdHandle(-10), 128)
+# 每个包的识别码、CRC32、时间戳、包大小
+sOnePackageHeader = struct.Struct('8sIIIIIII')
+# Tipos estructurados de las muestras (mismo orden de bytes nativo que struct 'hhh' / 'hh')
+ACC_GYRO_DTYPE = np.dtype([('x', np.int16), ('y', np.int16), ('z', np.int16)])
+TEMPER_DTYPE = np.dtype([('bodySurface', np.int16), ('ambient', np.int16)])
+HEART_DTYPE = np.dtype([('raw', np.int16), ('hr', np.int16)])
+
+SENSOR_COLUMNS = csvFileHead[0][1:-1]
+FIXED_DECIMAL_COLUMNS = ('acc_x', 'acc_y', 'acc_z', 'gyr_x', 'gyr_y', 'gyr_z')
+HEART_COLUMNS = ('hr_raw', 'hr')
+COLUMNAR_EXTENSIONS = ('.parquet', '.feather')
+RAW_FORMAT_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# 解决鼠标点击命令行窗口程序停止问题 (solo consola de Windows; en Linux no existe windll)
+if sys.platform == 'win32':
+    kernel32 = ctypes.windll.kernel32
+    kernel32.SetConsoleMode(kernel32.GetStdHandle(-10), 128)
 # -------------------------------
 
 
@@ -47,104 +76,319 @@ def debugInfo(string):
     # print(string)
     pass
 
-def csv_write_heard(path, csvData):
-    with open(path, 'a+', encoding='utf-8_sig', newline='') as f:
-        writer = csv.writer(f, dialect='excel')
-        for row in csvData:
-            writer.writerow(row)
-    return True
-# 直接字典字段写入到CSV文件中
-
-
-def csv_write_dict(path, csvHeard, csvData):
-    with open(path, 'a+', encoding='utf-8', newline='')as f:
-        writer = csv.DictWriter(f, fieldnames=csvHeard)
-        # writer.writeheader()
-        writer.writerows(csvData)
-
 def csv_file_remove(path):
     if os.path.exists(path):  # 如果文件存在
         os.remove(path)
     else:
         debugInfo('no such file:%s' % path)  # 则返回文件不存在
 
-def calcAccGryro(value, range):
-    if value > 0:
-        Denominator = 0x7fff
-    else:
-        Denominator = 0x8000
-    calc = value * range / Denominator
-    return format(calc, '.8f')
-
-def read_one_package_raw_date(allFileDataBuff:bytearray, onePackageData, readFileQueue):
-    startRecnizOffset = -1
-    endRecnizOffset = -1
-    while(1):
-        try:
-            if readFileQueue != '':
-                readData = readFileQueue.get(True, 1)
-                allFileDataBuff.extend(readData)
-                getDataLen = len(readData)
+def calcAccGryro(values, range):
+    # Las muestras son int16: la conversión es una consulta en la tabla del rango
+    return scale_table(range)[values.view(np.uint16)]
+
+@lru_cache(maxsize=None)
+def scale_table(range):
+    """
+    Tabla de 65536 valores escalados para un rango de acc/gyro, indexada por la
+    muestra int16 vista como uint16: positivos entre 0x7fff, negativos y cero entre 0x8000.
+    """
+    values = np.arange(1 << 16, dtype=np.uint16).view(np.int16).astype(np.int64) * range
+    return np.where(values > 0, values / 0x7fff, values / 0x8000)
+
+@lru_cache(maxsize=None)
+def scale_string_table(range):
+    # La misma tabla ya formateada con 8 decimales, tal como va en el CSV
+    return np.array(np.char.mod('%.8f', scale_table(range)).tolist(), dtype=object)
+
+def sample_index(rawDataSize, maxCount):
+    # Fila de cada muestra del sensor dentro del paquete: int(i * maxCount / rawDataSize)
+    if rawDataSize <= 0:
+        return np.zeros(0, dtype=np.int64)
+    return (np.arange(rawDataSize) * (maxCount / rawDataSize)).astype(np.int64)
+
+def package_time_axis(itermStartTimeStamp, itermEndTimeStamp, maxCount):
+    timeAmongStep = (
+        (itermEndTimeStamp - itermStartTimeStamp)*1000)/(maxCount)
+    return (itermStartTimeStamp*1000 + np.arange(maxCount)*timeAmongStep).astype(np.int64)
+
+def dense_column(maxCount, index, values):
+    column = np.full(maxCount, '', dtype=object)
+    column[index] = values
+    return column
+
+def parse_package_header(onePackageData):
+    """
+    Devuelve (itermStartTimeStamp, itermEndTimeStamp, rawDataSizeAcc, rawDataSizeGyro,
+    rawDataSizeTemper, rawDataSizeHeart) o None si la cabecera no se puede leer,
+    el CRC32 no coincide o el paquete no tiene muestras.
+    """
+    try:
+        (recString, crc32, itermStartTimeStamp, itermEndTimeStamp, rawDataSizeAcc, rawDataSizeGyro,
+            rawDataSizeTemper, rawDataSizeHeart) = sOnePackageHeader.unpack(onePackageData[0:sOnePackageHeader.size])
+    except:
+        debugInfo('onePackageData is empty!!!')
+        return None
+    # 检查CRC32
+    calcCrc32 = binascii.crc32(onePackageData[len(recString)+4:])
+    if calcCrc32 != crc32:
+        debugInfo('calcCrc32 != crc32')
+        return None
+    if max(rawDataSizeAcc, rawDataSizeGyro, rawDataSizeTemper, rawDataSizeHeart) <= 0:
+        return None
+    return (itermStartTimeStamp, itermEndTimeStamp, rawDataSizeAcc, rawDataSizeGyro,
+            rawDataSizeTemper, rawDataSizeHeart)
+
+def decode_package(payload, rawDataSizeAcc, rawDataSizeGyro, rawDataSizeTemper, rawDataSizeHeart):
+    """
+    Decodifica el bloque de datos de un paquete con numpy.frombuffer.
+    Devuelve, en el orden de SENSOR_COLUMNS, un par (filas, valores) por columna
+    o None si el tamaño del bloque no coincide con la cabecera.
+    Acc/gyro se devuelven como muestras int16 sin escalar (vistas sobre `payload`):
+    el escritor las convierte con las tablas de su rango (scale_table/scale_string_table).
+    """
+    accByteSize = rawDataSizeAcc*ACC_GYRO_DTYPE.itemsize
+    GyroByteSize = rawDataSizeGyro*ACC_GYRO_DTYPE.itemsize
+    TemperByteSize = rawDataSizeTemper*TEMPER_DTYPE.itemsize
+    heartByteSize = rawDataSizeHeart*HEART_DTYPE.itemsize
+    if len(payload) != accByteSize + GyroByteSize + TemperByteSize + heartByteSize:
+        return None
+    maxCount = max(rawDataSizeAcc, rawDataSizeGyro,
+                   rawDataSizeTemper, rawDataSizeHeart)
+    offset = 0
+    acc = np.frombuffer(payload, ACC_GYRO_DTYPE, rawDataSizeAcc, offset)
+    offset += accByteSize
+    gyro = np.frombuffer(payload, ACC_GYRO_DTYPE, rawDataSizeGyro, offset)
+    offset += GyroByteSize
+    temper = np.frombuffer(payload, TEMPER_DTYPE, rawDataSizeTemper, offset)
+    offset += TemperByteSize
+    heart = np.frombuffer(payload, HEART_DTYPE, rawDataSizeHeart, offset)
+
+    accIndex = sample_index(rawDataSizeAcc, maxCount)
+    gyroIndex = sample_index(rawDataSizeGyro, maxCount)
+    temperIndex = sample_index(rawDataSizeTemper, maxCount)
+    heartIndex = sample_index(rawDataSizeHeart, maxCount)
+
+    sensors = []
+    for axis in ('x', 'y', 'z'):
+        sensors.append((accIndex, acc[axis]))
+    for axis in ('x', 'y', 'z'):
+        sensors.append((gyroIndex, gyro[axis]))
+    for field in ('bodySurface', 'ambient'):
+        sensors.append((temperIndex, temper[field] / 10))
+    for field in ('raw', 'hr'):
+        sensors.append((heartIndex, heart[field].copy()))
+    return sensors
+
+class CsvRawWriter:
+    """
+    Escribe los paquetes decodificados en el CSV de 01_raw con el formato de siempre:
+    acc/gyro con 8 decimales, celdas vacías donde el sensor no tiene muestra
+    y las remarks en la primera fila.
+    El fichero se abre una sola vez con un buffer grande y las filas (tuplas) se
+    acumulan y se escriben en lotes de CSV_BATCH_ROWS.
+    """
+    def __init__(self, path, remarks, append=False):
+        self.path = path
+        if append:
+            # Reanudación: el CSV ya tiene la cabecera (y el BOM), se sigue escribiendo al final
+            self._file = open(path, 'a', encoding='utf-8', newline='', buffering=CSV_WRITE_BUFFER_SIZE)
+            self._writer = csv.writer(self._file, dialect='excel')
+        else:
+            self._file = open(path, 'w', encoding='utf-8-sig', newline='', buffering=CSV_WRITE_BUFFER_SIZE)
+            self._writer = csv.writer(self._file, dialect='excel')
+            self._writer.writerows(csvFileHead)
+        self._rows = []
+
+    @staticmethod
+    def prepare_package(maxCount, sensors, accRange, gyroRange):
+        # Formatea las columnas de sensores a texto (puede ejecutarse en los procesos del pool);
+        # acc/gyro se toman ya formateados de la tabla de su rango
+        columns = []
+        ranges = (accRange,)*3 + (gyroRange,)*3
+        for k, (index, values) in enumerate(sensors):
+            if SENSOR_COLUMNS[k] in FIXED_DECIMAL_COLUMNS:
+                values = scale_string_table(ranges[k])[values.view(np.uint16)]
             else:
-                getDataLen = 0
-        except:
-            readFileQueue = ''
-            getDataLen = 0
+                values = values.tolist()
+            columns.append(dense_column(maxCount, index, values).tolist())
+        return columns
 
-        if startRecnizOffset == -1:
-            try:
-                startRecnizOffset = allFileDataBuff.index(
-                    PACKAGE_HEARD_KEY)
-            except:
-                break
+    def write_package(self, dateTime, maxCount, columns, remarks=''):
+        remarksColumn = [''] * maxCount
+        remarksColumn[0] = remarks
+        self._rows.extend(zip(dateTime.tolist(), *columns, remarksColumn))
+        if len(self._rows) >= CSV_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        self._writer.writerows(self._rows)
+        self._rows = []
+        self._file.flush()
+
+    def sync(self):
+        # Vuelca todo a disco y devuelve el tamaño del CSV (para el punto de control)
+        self.flush()
+        os.fsync(self._file.fileno())
+        return os.fstat(self._file.fileno()).st_size
+
+    def close(self):
+        if self._file.closed:
+            return
         try:
-            endRecnizOffset = allFileDataBuff.index(
-                PACKAGE_HEARD_KEY, 1)
-            onePackageData.extend(
-                allFileDataBuff[0:endRecnizOffset])
-            debugInfo('endRecnizOffset:'+str(endRecnizOffset) +
-                      ' allFileDataBuff size:'+str(len(allFileDataBuff)))
-            return endRecnizOffset
-        except:
-            if getDataLen == 0:
-                onePackageData.extend(allFileDataBuff[0:])
-                debugInfo('getDataLen == 0')
-                break
-            else:
+            self.flush()
+        finally:
+            self._file.close()
+
+class ArrowRawWriter:
+    """
+    Salida columnar (Parquet o Feather) del 01_raw: dateTime int64, sensores
+    acc/gyro/temperatura en float32, hr_raw/hr en int16 y nulos donde el sensor
+    no tiene muestra. Las remarks se guardan como metadato del fichero.
+    Los paquetes se acumulan y se escriben en bloques de BATCH_ROWS filas.
+    """
+    BATCH_ROWS = 1 << 18
+
+    def __init__(self, path, remarks):
+        import pyarrow as pa
+        self._pa = pa
+        fields = [pa.field('dateTime', pa.int64())]
+        for name in SENSOR_COLUMNS:
+            fields.append(pa.field(name, pa.int16() if name in HEART_COLUMNS else pa.float32()))
+        self.schema = pa.schema(fields, metadata={'remarks': remarks})
+        if path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            self._writer = pa.ipc.new_file(path, self.schema,
+                                           options=pa.ipc.IpcWriteOptions(compression='zstd'))
+        self._pending = []
+        self._pendingRows = 0
+
+    @staticmethod
+    def prepare_package(maxCount, sensors, accRange, gyroRange):
+        # Escala acc/gyro con la tabla de su rango; el resto de sensores no cambia
+        ranges = (accRange,)*3 + (gyroRange,)*3
+        return [(index, calcAccGryro(values, ranges[k])) if k < len(ranges) else (index, values)
+                for k, (index, values) in enumerate(sensors)]
+
+    def write_package(self, dateTime, maxCount, sensors, remarks=''):
+        self._pending.append((dateTime, maxCount, sensors))
+        self._pendingRows += maxCount
+        if self._pendingRows >= self.BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        pa = self._pa
+        arrays = [pa.array(np.concatenate([package[0] for package in self._pending]), pa.int64())]
+        for k, field in enumerate(self.schema):
+            if k == 0:
                 continue
+            dtype = np.int16 if field.name in HEART_COLUMNS else np.float32
+            values = np.zeros(self._pendingRows, dtype=dtype)
+            mask = np.ones(self._pendingRows, dtype=bool)
+            offset = 0
+            for dateTime, maxCount, sensors in self._pending:
+                index, sensorValues = sensors[k - 1]
+                values[offset + index] = sensorValues
+                mask[offset + index] = False
+                offset += maxCount
+            arrays.append(pa.array(values, field.type, mask=mask))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self._pending = []
+        self._pendingRows = 0
 
-def run_bin2csv(bin_file, csv_file):  # 建立一个任务线程类:  # 在启动线程后任务从这个函数里面开始执行
-    tempTimesStamp = 0
-    csvFileHeadDict = dfCsvFileHeadDict_
-    onePackageData = bytearray()
-    allFileDataBuff = bytearray()
-    readFileQueue = Queue(maxsize=0)
-    debugInfo('saveFile:'+csv_file)
-    if os.path.exists(bin_file) == False:
-        print('bin2csv: ' + bin_file + ': No such file or directory')
-        return 1
-    _thread.start_new_thread(ReadFileThread, (bin_file, readFileQueue))
-    time.sleep(1)
-    if readFileQueue.empty() == True:
-        debugInfo('file queue is empty')
-        return 1
-    csv_file_remove(csv_file)
-    csv_write_heard(csv_file, csvFileHead)
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+def open_raw_writer(path, remarks):
+    # El formato de salida se elige por la extensión del fichero de 01_raw
+    if path.endswith(COLUMNAR_EXTENSIONS):
+        return ArrowRawWriter(path, remarks)
+    return CsvRawWriter(path, remarks)
+
+class ConversionCheckpoint:
+    """
+    Punto de control de la conversión a CSV, junto al fichero de 01_raw
+    (<sesión>.checkpoint.json). Guarda el siguiente paquete a decodificar, su
+    posición en el BIN, el tamaño del CSV hasta el último paquete completo y el
+    estado de la corrección de segundos, además del tamaño y la fecha del BIN
+    para no reanudar sobre un fichero distinto.
+    Solo se usa con salida CSV: Parquet/Feather no se pueden continuar por el final.
+    """
+    def __init__(self, bin_file, csv_file, headerPackeNum):
+        self.path = os.path.splitext(csv_file)[0] + CHECKPOINT_SUFFIX
+        self.csv_file = csv_file
+        binStat = os.stat(bin_file)
+        self.identity = {
+            'bin_size': binStat.st_size,
+            'bin_mtime': binStat.st_mtime,
+            'header_package_num': headerPackeNum,
+        }
 
-    startReadQueueCount = QUEUE_ONE_ITERM_BYTE_SIZE
+    def load(self, packageCount):
+        """
+        Devuelve el estado guardado o None si no hay punto de control válido
+        para este BIN y este CSV.
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as checkpointFile:
+                state = json.load(checkpointFile)
+        except (OSError, ValueError):
+            return None
+        if any(state.get(key) != value for key, value in self.identity.items()):
+            return None
+        if not 0 < state.get('package', 0) <= packageCount:
+            return None
+        if not os.path.exists(self.csv_file) or os.path.getsize(self.csv_file) < state.get('csv_size', 0):
+            return None
+        return state
+
+    def save(self, package, byteOffset, csvSize, tempTimesStamp, percentCount):
+        state = dict(self.identity, package=package, byte_offset=byteOffset, csv_size=csvSize,
+                     temp_timestamp=tempTimesStamp, written_packages=percentCount)
+        tempPath = self.path + '.tmp'
+        with open(tempPath, 'w', encoding='utf-8') as checkpointFile:
+            json.dump(state, checkpointFile)
+        os.replace(tempPath, self.path)
+
+    def remove(self):
+        csv_file_remove(self.path)
+
+def scan_packages(fileData, start):
+    """
+    Recorre una sola vez el fichero buscando las cabeceras MDTCPACK a partir de `start`
+    y devuelve los límites (inicio, fin) de cada paquete, en orden.
+
+    Cada paquete va desde su posición hasta la siguiente cabecera (o el final del
+    fichero); el primero empieza en `start` aunque haya bytes antes de la cabecera.
+    """
+    packages = []
+    if fileData.find(PACKAGE_HEARD_KEY, start) == -1:
+        return packages
+    packageStart = start
     while True:
-        allFileDataBuff.extend(readFileQueue.get(True, 5))
-        if startReadQueueCount > REMARKES_SIZE:
-            break
-        startReadQueueCount += QUEUE_ONE_ITERM_BYTE_SIZE
+        packageEnd = fileData.find(PACKAGE_HEARD_KEY, packageStart + 1)
+        if packageEnd == -1:
+            packages.append((packageStart, len(fileData)))
+            return packages
+        packages.append((packageStart, packageEnd))
+        packageStart = packageEnd
+
+def read_file_header(fileView):
+    """
+    Lee las remarks y la cabecera del fichero BIN.
+    Devuelve (remarkesString, headerPackeNum, accRange, gyroRange, dataOffset) o None.
+    """
     # 解析remarkes
     remarkesString = ''
     try:
         sFileRemarkes = struct.Struct(str(REMARKES_SIZE)+'s')
         (remarkes,) = sFileRemarkes.unpack(
-            allFileDataBuff[0:sFileRemarkes.size])
-        allFileDataBuff = allFileDataBuff[sFileRemarkes.size:]
-        remarkesString = remarkes.decode('utf-8', 'ignore')            
+            fileView[0:sFileRemarkes.size])
+        remarkesString = remarkes.decode('utf-8', 'ignore')
         if '\0' in remarkesString:
             findEnd = remarkesString.index('\0')
             remarkesString = remarkesString[0:findEnd]
@@ -153,230 +397,405 @@ def run_bin2csv(bin_file, csv_file):  # 建立一个任务线程类:  # 在启
         debugInfo('remarkes:'+remarkesString)
     except:
         debugInfo('unpack remarkes faile')
-        return 1
-    # saveFileRemark = []
-    # saveFileRemark.append(csvFileHeadDict)
-    # saveFileRemark[0]['remarks'] = str(remarkes)
-    # csv_write_dict(csv_file, csvFileHead[0], saveFileRemark)
+        return None
     # 解析头
     try:
         sFileHeader = struct.Struct('4sIHH')
         (headerRecogni, headerPackeNum, accRange, gyroRange) = sFileHeader.unpack(
-            allFileDataBuff[0:sFileHeader.size])
+            fileView[sFileRemarkes.size:sFileRemarkes.size+sFileHeader.size])
     except:
-        return 1
-    allFileDataBuff = allFileDataBuff[sFileHeader.size:]
+        return None
     debugInfo('headerRecogni:'+headerRecogni.decode('utf-8', 'ignore'))
     debugInfo('headerPackeNum:'+str(headerPackeNum))
     if headerRecogni.decode('utf-8', 'ignore') != FILE_HEADER_RECOGNITION_STRING:
         debugInfo('headerRecogni != FILE_HEADER_RECOGNITION_STRING')
-        time.sleep(0.5)
+        return None
+    return remarkesString, headerPackeNum, accRange, gyroRange, sFileRemarkes.size+sFileHeader.size
+
+def check_bin_integrity(bin_file, max_bad_ratio=1.0):
+    """
+    Validación rápida del BIN antes de encolar el pipeline: una sola pasada sobre
+    los paquetes (vistas del mmap, sin decodificar) comprobando cabecera, CRC32 y
+    tamaño del bloque de datos. Devuelve el informe de integridad como diccionario;
+    report['valid'] es False si la cabecera no es válida, no hay ningún paquete
+    válido o la proporción de paquetes dañados supera `max_bad_ratio`.
+    """
+    startTime = time.time()
+    report = {
+        'file': os.path.basename(bin_file),
+        'file_size': 0,
+        'header_ok': False,
+        'header_package_num': 0,
+        'packages_found': 0,
+        'packages_checked': 0,
+        'valid_packages': 0,
+        'duplicates': 0,
+        'unparsable': [],
+        'bad_crc': [],
+        'empty': [],
+        'size_mismatch': [],
+        'bad_ratio': 0.0,
+        'samples': {'acc': 0, 'gyro': 0, 'temp': 0, 'hr': 0},
+        'first_timestamp': None,
+        'last_timestamp': None,
+        'time_gaps': {'count': 0, 'total_seconds': 0, 'gaps': []},
+        'backwards_timestamps': 0,
+        'valid': False,
+        'reason': '',
+        'elapsed_seconds': 0.0,
+    }
+    with ExitStack() as stack:
+        try:
+            report['file_size'] = os.path.getsize(bin_file)
+            fileData = stack.enter_context(map_bin_file(bin_file))
+        except (OSError, ValueError) as e:
+            report['reason'] = f'No se puede abrir el fichero: {e}'
+            return report
+        issueCounts = sweep_packages(fileData, report)
+    report['elapsed_seconds'] = round(time.time() - startTime, 3)
+    if issueCounts is None:
+        report['reason'] = 'Cabecera MDTC no válida'
+        return report
+
+    for kind, count in issueCounts.items():
+        report[kind + '_count'] = count
+    badPackages = sum(issueCounts.values())
+    if report['packages_checked']:
+        report['bad_ratio'] = round(badPackages / report['packages_checked'], 6)
+    if report['valid_packages'] == 0:
+        report['reason'] = 'El fichero no contiene paquetes válidos'
+    elif report['bad_ratio'] > max_bad_ratio:
+        report['reason'] = (f'{badPackages} de {report["packages_checked"]} paquetes dañados '
+                            f'({report["bad_ratio"]:.1%})')
+    else:
+        report['valid'] = True
+    return report
+
+def sweep_packages(fileData, report):
+    """
+    Recorre los paquetes del BIN comprobando cabecera, CRC32 y tamaño y va
+    rellenando `report`. Devuelve el número de paquetes dañados por tipo o None
+    si la cabecera del fichero no es válida.
+    """
+    issueCounts = {'unparsable': 0, 'bad_crc': 0, 'empty': 0, 'size_mismatch': 0}
+
+    def add_issue(kind, j):
+        issueCounts[kind] += 1
+        if len(report[kind]) < MAX_REPORTED_ISSUES:
+            report[kind].append(j)
+
+    fileView = memoryview(fileData)
+    fileHeader = read_file_header(fileView)
+    if fileHeader is None:
+        return None
+    remarkesString, headerPackeNum, accRange, gyroRange, dataOffset = fileHeader
+    report['header_ok'] = True
+    report['header_package_num'] = headerPackeNum
+    packages = scan_packages(fileData, dataOffset)
+    report['packages_found'] = len(packages)
+    packages = packages[:headerPackeNum]
+    report['packages_checked'] = len(packages)
+
+    previousPackage = None
+    previousStart = previousEnd = None
+    for j, (packageStart, packageEnd) in enumerate(packages):
+        onePackageData = fileView[packageStart:packageEnd]
+        if previousPackage == onePackageData:
+            report['duplicates'] += 1
+            continue
+        previousPackage = onePackageData
+        try:
+            (recString, crc32, itermStartTimeStamp, itermEndTimeStamp, rawDataSizeAcc, rawDataSizeGyro,
+                rawDataSizeTemper, rawDataSizeHeart) = sOnePackageHeader.unpack(onePackageData[0:sOnePackageHeader.size])
+        except struct.error:
+            add_issue('unparsable', j)
+            continue
+        if binascii.crc32(onePackageData[len(recString)+4:]) != crc32:
+            add_issue('bad_crc', j)
+            continue
+        sizes = (rawDataSizeAcc, rawDataSizeGyro, rawDataSizeTemper, rawDataSizeHeart)
+        if max(sizes) <= 0:
+            add_issue('empty', j)
+            continue
+        payloadSize = ((rawDataSizeAcc + rawDataSizeGyro)*ACC_GYRO_DTYPE.itemsize
+                       + rawDataSizeTemper*TEMPER_DTYPE.itemsize + rawDataSizeHeart*HEART_DTYPE.itemsize)
+        if len(onePackageData) - sOnePackageHeader.size != payloadSize:
+            add_issue('size_mismatch', j)
+            continue
+
+        report['valid_packages'] += 1
+        for key, size in zip(('acc', 'gyro', 'temp', 'hr'), sizes):
+            report['samples'][key] += size
+        if report['first_timestamp'] is None:
+            report['first_timestamp'] = itermStartTimeStamp
+        report['last_timestamp'] = itermEndTimeStamp
+        if previousEnd is not None:
+            if itermStartTimeStamp < previousStart:
+                report['backwards_timestamps'] += 1
+            elif itermStartTimeStamp - previousEnd > TIME_GAP_SECONDS:
+                gaps = report['time_gaps']
+                gaps['count'] += 1
+                gaps['total_seconds'] += itermStartTimeStamp - previousEnd
+                if len(gaps['gaps']) < MAX_REPORTED_ISSUES:
+                    gaps['gaps'].append({'package': j, 'from': previousEnd, 'to': itermStartTimeStamp,
+                                         'seconds': itermStartTimeStamp - previousEnd})
+        previousStart, previousEnd = itermStartTimeStamp, itermEndTimeStamp
+    return issueCounts
+
+def write_integrity_report(bin_file, report):
+    # El informe se guarda en la misma carpeta que el BIN (00_bin)
+    reportPath = os.path.join(os.path.dirname(bin_file), INTEGRITY_REPORT_NAME)
+    with open(reportPath, 'w', encoding='utf-8') as reportFile:
+        json.dump(report, reportFile, indent=2)
+    return reportPath
+
+@contextmanager
+def map_bin_file(bin_file):
+    with open(bin_file, 'rb') as readOpenFile:
+        fileData = mmap.mmap(readOpenFile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield fileData
+        finally:
+            try:
+                fileData.close()
+            except BufferError:
+                # Quedan vistas vivas (p. ej. en la traza de una excepción); el GC cerrará el mmap
+                pass
+
+def run_bin2csv(bin_file, csv_file, workers=1, resume=True, writer_factory=None):  # 建立一个任务线程类:  # 在启动线程后任务从这个函数里面开始执行
+    """
+    Convierte el BIN del reloj al fichero de 01_raw. Si `csv_file` termina en
+    .parquet o .feather se escribe en formato columnar en lugar de CSV.
+    Con `workers` > 1 los paquetes se decodifican en varios procesos (0 = todos los núcleos).
+    En CSV, si una conversión anterior se interrumpió (cancelación o reinicio) y
+    `resume` es True, se continúa desde su punto de control en lugar de empezar de cero.
+    Con `writer_factory(csv_file, remarks)` los paquetes se entregan a otro escritor
+    (p. ej. directamente a los segmentos de 02_seg) y no se escribe el 01_raw.
+    """
+    debugInfo('saveFile:'+csv_file)
+    if os.path.exists(bin_file) == False:
+        print('bin2csv: ' + bin_file + ': No such file or directory')
         return 1
-    percentCount = 0
-    lastPercent = 0
-    temptemp= None
-    for j in range(0, headerPackeNum):
+    if not workers:
+        workers = os.cpu_count() or 1
+    with ExitStack() as stack:
+        try:
+            fileData = stack.enter_context(map_bin_file(bin_file))
+        except (OSError, ValueError):
+            debugInfo('can not open file')
+            return 1
+        return convert_packages(bin_file, fileData, csv_file, workers, resume, writer_factory)
+
+def convert_packages(bin_file, fileData, csv_file, workers, resume=True, writer_factory=None):
+    fileView = memoryview(fileData)
+
+    fileHeader = read_file_header(fileView)
+    if fileHeader is None:
+        if writer_factory is None:
+            csv_file_remove(csv_file)
+        return 1
+    remarkesString, headerPackeNum, accRange, gyroRange, dataOffset = fileHeader
+    packages = scan_packages(fileData, dataOffset)[:headerPackeNum]
+
+    checkpoint = None
+    state = None
+    if writer_factory is not None:
+        # Escritor externo: no hay 01_raw que borrar ni desde el que reanudar
+        writer = writer_factory(csv_file, remarkesString)
+    else:
+        if not csv_file.endswith(COLUMNAR_EXTENSIONS):
+            checkpoint = ConversionCheckpoint(bin_file, csv_file, headerPackeNum)
+            if resume:
+                state = checkpoint.load(len(packages))
+        if state is None:
+            csv_file_remove(csv_file)
+            if checkpoint is not None:
+                checkpoint.remove()
+            writer = open_raw_writer(csv_file, remarkesString)
+        else:
+            # Se descarta lo escrito después del último punto de control y se sigue desde ahí
+            print(f'bin2csv: reanudando desde el paquete {state["package"]} de {len(packages)}')
+            with open(csv_file, 'r+b') as csvFile:
+                csvFile.truncate(state['csv_size'])
+            writer = CsvRawWriter(csv_file, remarkesString, append=True)
+    firstIndex = state['package'] if state else 0
+
+    if workers > 1 and len(packages) - firstIndex > PARALLEL_CHUNK_PACKAGES:
+        decoded = decode_packages_parallel(bin_file, packages, accRange, gyroRange, workers,
+                                           writer.prepare_package, firstIndex)
+    else:
+        previousPackage = None
+        if firstIndex > 0:
+            previousPackage = fileView[packages[firstIndex - 1][0]:packages[firstIndex - 1][1]]
+        decoded = decode_packages(fileView, packages[firstIndex:], accRange, gyroRange,
+                                  writer.prepare_package, firstIndex, previousPackage)
+    try:
+        write_packages(decoded, headerPackeNum, remarkesString, writer, packages, checkpoint, state)
+    finally:
+        writer.close()
+    if checkpoint is not None:
+        checkpoint.remove()
+    return 0
+
+def decode_packages(fileView, packages, accRange, gyroRange, prepare, firstIndex=0, previousPackage=None):
+    """
+    Decodifica en orden los paquetes `packages` (límites dentro de `fileView`).
+    Genera (j, cabecera, datos) para cada paquete con cabecera y CRC válidos, donde
+    datos es el resultado de `prepare(maxCount, sensores, accRange, gyroRange)` del escritor de salida,
+    o None si el bloque de datos no cuadra con la cabecera.
+    `previousPackage` es el paquete anterior al primero, para descartar duplicados.
+    """
+    temptemp = previousPackage
+    for j, (packageStart, packageEnd) in enumerate(packages, firstIndex):
         # 读取一包数据
-        onePackageData = bytearray()
         debugInfo('PackeNum:'+str(j))
-        cutSize = read_one_package_raw_date(allFileDataBuff, onePackageData, readFileQueue)
-        allFileDataBuff = allFileDataBuff[cutSize:]
+        onePackageData = fileView[packageStart:packageEnd]
         # 解决最后一包数据可能重复的问题
         if temptemp == onePackageData:
             debugInfo('temptemp == self.onePackageData')
             continue
         temptemp = onePackageData
         debugInfo('get onePackageData')
-        # 读取每个包的识别码、CRC32、时间戳、包大小
-        sOnePackageHeader = struct.Struct('8sIIIIIII')
-        rawDataindex = sOnePackageHeader.size
-        try:
-            (recString, crc32, itermStartTimeStamp, itermEndTimeStamp, rawDataSizeAcc, rawDataSizeGyro,
-                rawDataSizeTemper, rawDataSizeHeart) = sOnePackageHeader.unpack(onePackageData[0:rawDataindex])
-            debugInfo(' recString: '+str(recString)+' crc32:' + hex(crc32) +
-                      ' onePackageData size:'+str(len(onePackageData)))
-        except:
-            debugInfo('onePackageData is empty!!!')
-            continue
-        # 如果不是包的开头、校验不通过则寻找下一个头
-        sAcc = struct.Struct('hhh')
-        sGyro = struct.Struct('hhh')
-        sTemper = struct.Struct('hh')
-        sHeart = struct.Struct('hh')
-        # acc
-        accByteSize = rawDataSizeAcc*sAcc.size
-        debugInfo('\nrawDataSizeAcc:'+str(rawDataSizeAcc))
-        # gyro
-        GyroByteSize = rawDataSizeGyro*sGyro.size
-        debugInfo('\nrawDataSizeGyro:'+str(rawDataSizeGyro))
-        # temper
-        TemperByteSize = rawDataSizeTemper*sTemper.size
-        debugInfo('\nrawDataSizeTemper:'+str(rawDataSizeTemper))
-        # heart
-        heartByteSize = rawDataSizeHeart*sHeart.size
-        debugInfo('\nrawDataSizeHeart:'+str(rawDataSizeHeart))
-
-        # 检查CRC32
-        calcCrc32 = binascii.crc32(
-            onePackageData[len(recString)+4:])
-        debugInfo('calcCrc32:'+hex(calcCrc32))
-        if calcCrc32 != crc32:
-            debugInfo('calcCrc32 != crc32')
+        header = parse_package_header(onePackageData)
+        if header is None:
             continue
-        # 截取原始值数据
-        onePackageData = onePackageData[sOnePackageHeader.size:]
-        # 解析iterm
-        saveFileOnePackge = []  # 创建的是多行三列的二维列表
+        # 解析原始数据
+        sensors = decode_package(onePackageData[sOnePackageHeader.size:], *header[2:])
+        if sensors is not None:
+            sensors = prepare(max(header[2:]), sensors, accRange, gyroRange)
+        yield j, header, sensors
+
+def decode_package_range(bin_file, packages, firstIndex, previousPackage, accRange, gyroRange, prepare):
+    # Tarea de un proceso del pool: abre su propio mmap y decodifica un tramo de paquetes
+    with map_bin_file(bin_file) as fileData:
+        fileView = memoryview(fileData)
+        previous = fileView[previousPackage[0]:previousPackage[1]] if previousPackage else None
+        decoded = list(decode_packages(fileView, packages, accRange, gyroRange, prepare, firstIndex, previous))
+        del previous
+        fileView.release()
+    return decoded
+
+def decode_packages_parallel(bin_file, packages, accRange, gyroRange, workers, prepare, startIndex=0):
+    """
+    Igual que decode_packages, pero repartiendo tramos de PARALLEL_CHUNK_PACKAGES
+    paquetes entre `workers` procesos, empezando en el paquete `startIndex`.
+    Los resultados se devuelven en orden y como mucho hay 2 tramos por proceso
+    en vuelo, para acotar la memoria.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for firstIndex in range(startIndex, len(packages), PARALLEL_CHUNK_PACKAGES):
+            previousPackage = packages[firstIndex - 1] if firstIndex > 0 else None
+            pending.append(executor.submit(decode_package_range, bin_file,
+                                           packages[firstIndex:firstIndex + PARALLEL_CHUNK_PACKAGES],
+                                           firstIndex, previousPackage, accRange, gyroRange, prepare))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def write_packages(decoded, headerPackeNum, remarkesString, writer, packages=None, checkpoint=None, state=None):
+    """
+    Escribe los paquetes decodificados aplicando la corrección de segundos.
+    Con `checkpoint`, cada CHECKPOINT_PACKAGES paquetes escritos se vuelca el CSV
+    y se guarda el punto de control; `state` es el punto de control desde el que se reanuda.
+    """
+    tempTimesStamp = state['temp_timestamp'] if state else 0
+    percentCount = state['written_packages'] if state else 0
+    lastPercent = 0
+    for j, header, sensors in decoded:
+        (itermStartTimeStamp, itermEndTimeStamp, rawDataSizeAcc, rawDataSizeGyro,
+            rawDataSizeTemper, rawDataSizeHeart) = header
         maxCount = max(rawDataSizeAcc, rawDataSizeGyro,
                        rawDataSizeTemper, rawDataSizeHeart)
-        if maxCount <= 0:
-            continue
-        
-        # 预处理秒误差
+
+        # 预处理秒误差 (depende del paquete anterior: siempre en orden, en este proceso)
         if itermStartTimeStamp - tempTimesStamp >= 1 and tempTimesStamp != 0:
             itermStartTimeStamp -= 1
             # print('itermStartTimeStamp - tempTimesStamp >= 1')
         tempTimesStamp = itermEndTimeStamp
-        
-        timeAmongStep = (
-            (itermEndTimeStamp - itermStartTimeStamp)*1000)/(maxCount)
 
         debugInfo('maxCount:'+str(maxCount))
         debugInfo('itermStartTimeStamp:'+str(itermStartTimeStamp))
         debugInfo('itermEndTimeStamp:'+str(itermEndTimeStamp))
-        debugInfo('time among:'+str(timeAmongStep))
-        # 第一行插入remarks
-        if j == 0:
-            csvFileHeadDict['remarks'] = remarkesString
-            csvFileHeadDict = deepcopy(csvFileHeadDict)
-        for i in range(maxCount):
-            timeCalc = itermStartTimeStamp*1000+i*timeAmongStep
-            # timeArray = time.localtime(timeCalc/1000)
-            # styleTime = time.strftime("%Y-%m-%d %H:%M:%S", timeArray)
-            # csvFileHeadDict['dateTime'] = styleTime + '.' + str(int(timeCalc % 1000))
-            csvFileHeadDict['dateTime'] = int(timeCalc)
-            # csvFileHeadDict['dateTime'] = int(
-            #     itermStartTimeStamp*1000+i*timeAmongStep)
-            saveFileOnePackge.append(csvFileHeadDict)
-            # 需要深度复制 否则下次更改时会连之前的列表中的值一起更改
-            csvFileHeadDict = deepcopy(csvFileHeadDict)
-            csvFileHeadDict['remarks'] = ''
-        # 计算每个传感器的存储比例关系
-        # maxCount -= 1
-        temp = rawDataSizeAcc
-        if temp > 0:
-            accScale = maxCount/temp
-        else:
-            accScale = 0
-        temp = rawDataSizeGyro
-        if temp > 0:
-            gyroScale = maxCount/temp
-        else:
-            gyroScale = 0
-        temp = rawDataSizeTemper
-        if temp > 0:
-            temperScale = maxCount/temp
-        else:
-            temperScale = 0
-        temp = rawDataSizeHeart
-        if temp > 0:
-            heartScale = maxCount/temp
-        else:
-            heartScale = 0
-        debugInfo(' accScale:'+str(accScale)+' gyroScale:'+str(gyroScale) +
-                  ' temperScale:'+str(temperScale)+' heartScale:'+str(heartScale))
-        startTimeArray = time.localtime(itermStartTimeStamp)
-        endTimeArray = time.localtime(itermEndTimeStamp)
-        styleTime = time.strftime("%Y--%m--%d %H:%M:%S\n", startTimeArray)
-        styleTime += time.strftime("%Y--%m--%d %H:%M:%S ", endTimeArray)
-        debugInfo(str(j)+' iterm')
-        debugInfo('\nstyleTime:\n'+styleTime)
-        # 解析原始数据
-        # Acc
-        sGetRawData = struct.Struct(str(
-            accByteSize)+'s'+str(GyroByteSize)+'s'+str(TemperByteSize)+'s'+str(heartByteSize)+'s')
-        try:
-            (accRawData, gyroRawData, temperRawData,
-                heartRawData) = sGetRawData.unpack(onePackageData[0:])
-        except:
+        if sensors is None:
             continue
-        for i in range(0, rawDataSizeAcc):
-            accIndex = int(i*accScale)
-            try:
-                (saveFileOnePackge[accIndex]['acc_x'], saveFileOnePackge[accIndex]['acc_y'],
-                    saveFileOnePackge[accIndex]['acc_z']) = sAcc.unpack(accRawData[0:sAcc.size])
-            except:
-                continue
-            saveFileOnePackge[accIndex]['acc_x'] = calcAccGryro(
-                saveFileOnePackge[accIndex]['acc_x'], accRange)
-            saveFileOnePackge[accIndex]['acc_y'] = calcAccGryro(
-                saveFileOnePackge[accIndex]['acc_y'], accRange)
-            saveFileOnePackge[accIndex]['acc_z'] = calcAccGryro(
-                saveFileOnePackge[accIndex]['acc_z'], accRange)
-            accRawData = accRawData[sAcc.size:]
-        # Gyro
-        for i in range(0, rawDataSizeGyro):
-            gyroIndex = int(i*gyroScale)
-            try:
-                (saveFileOnePackge[gyroIndex]['gyr_x'], saveFileOnePackge[gyroIndex]['gyr_y'],
-                    saveFileOnePackge[gyroIndex]['gyr_z']) = sGyro.unpack(gyroRawData[0:sGyro.size])
-            except:
-                continue
-            saveFileOnePackge[gyroIndex]['gyr_x'] = calcAccGryro(
-                saveFileOnePackge[gyroIndex]['gyr_x'], gyroRange)
-            saveFileOnePackge[gyroIndex]['gyr_y'] = calcAccGryro(
-                saveFileOnePackge[gyroIndex]['gyr_y'], gyroRange)
-            saveFileOnePackge[gyroIndex]['gyr_z'] = calcAccGryro(
-                saveFileOnePackge[gyroIndex]['gyr_z'], gyroRange)
-            gyroRawData = gyroRawData[sGyro.size:]
-        # temperate
-        for i in range(0, rawDataSizeTemper):
-            temperIndex = int(i*temperScale)
-            try:
-                (saveFileOnePackge[temperIndex]['bodySurface_temp'], saveFileOnePackge[temperIndex]
-                    ['ambient_temp']) = sTemper.unpack(temperRawData[0:sTemper.size])
-            except:
-                continue
-            saveFileOnePackge[temperIndex]['bodySurface_temp'] = saveFileOnePackge[temperIndex]['bodySurface_temp']/10
-            saveFileOnePackge[temperIndex]['ambient_temp'] = saveFileOnePackge[temperIndex]['ambient_temp']/10
-            temperRawData = temperRawData[sTemper.size:]
-        # heartrate
-        for i in range(0, rawDataSizeHeart):
-            heartIndex = int(i*heartScale)
-            try:
-                (saveFileOnePackge[heartIndex]['hr_raw'], saveFileOnePackge[heartIndex]
-                    ['hr']) = sHeart.unpack(heartRawData[0:sHeart.size])
-            except:
-                continue
-            heartRawData = heartRawData[sHeart.size:]
-
-        csv_write_dict(
-            csv_file, csvFileHead[0], saveFileOnePackge)
+        dateTime = package_time_axis(itermStartTimeStamp, itermEndTimeStamp, maxCount)
+        # 第一行插入remarks
+        writer.write_package(dateTime, maxCount, sensors, remarkesString if j == 0 else '')
         percentCount += 1
+        if checkpoint is not None and percentCount % CHECKPOINT_PACKAGES == 0:
+            checkpoint.save(j + 1, packages[j][1], writer.sync(), tempTimesStamp, percentCount)
         percent = int((percentCount / headerPackeNum)*100)
         if lastPercent != percent:
             lastPercent = percent
         flashSting = ['-', '\\', '|', '/']
         print(flashSting[percentCount % len(flashSting)] +
               ' '+str(lastPercent)+'%', end='\r', flush=True)
-    return 0
 
-def ReadFileThread(bin_file, readFileQueue):  # 建立一个任务线程类
-    readOpenFile = None
-    fileQueue = readFileQueue
-    readFile = bin_file
-    try:
-        readOpenFile = open(readFile, 'rb')
-    except:
-        debugInfo('can not open file')
-        return
-    while True:
-        debugInfo('put one iterm to queue')
-        data = readOpenFile.read(QUEUE_ONE_ITERM_BYTE_SIZE)
-        fileQueue.put(data)
-        if len(data) != QUEUE_ONE_ITERM_BYTE_SIZE:
+def find_bin_files(path, recursive=False):
+    # Un fichero BIN o todos los .BIN de una carpeta (y subcarpetas con `recursive`)
+    if os.path.isfile(path):
+        return [path]
+    binFiles = []
+    for root, dirs, files in os.walk(path):
+        binFiles.extend(os.path.join(root, name) for name in sorted(files) if name.upper().endswith('.BIN'))
+        if not recursive:
             break
-    readOpenFile.close()
-    debugInfo('all file data put to queue')
+        dirs.sort()
+    return binFiles
+
+def main(argv=None):
+    """
+    Conversión por lotes sin interfaz, p. ej. en servidores Linux:
+        python -m processing.tasks.bin2csv_task <BIN o carpeta> -w 0 -f parquet -o salida/
+    """
+    parser = argparse.ArgumentParser(description='Convierte ficheros BIN del reloj a CSV/Parquet/Feather.')
+    parser.add_argument('path', help='fichero .BIN o carpeta con ficheros .BIN')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='procesos para decodificar cada BIN (1 = secuencial, 0 = todos los núcleos)')
+    parser.add_argument('-f', '--format', choices=sorted(RAW_FORMAT_EXTENSIONS), default='csv',
+                        help='formato de salida')
+    parser.add_argument('-o', '--output', help='carpeta de salida (por defecto, junto a cada BIN)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='buscar BIN también en subcarpetas')
+    parser.add_argument('--check', action='store_true',
+                        help='validar la integridad (CRC) antes de convertir y omitir los BIN dañados')
+    parser.add_argument('--max-bad-ratio', type=float, default=0.5,
+                        help='con --check, proporción máxima de paquetes dañados admitida')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='ignorar los puntos de control de conversiones interrumpidas')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print('bin2csv: ' + args.path + ': No such file or directory')
+        return 1
+    binFiles = find_bin_files(args.path, args.recursive)
+    if not binFiles:
+        print('bin2csv: no se han encontrado ficheros .BIN en ' + args.path)
+        return 1
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    failed = []
+    for bin_file in binFiles:
+        outputDir = args.output or os.path.dirname(bin_file)
+        outputFile = os.path.join(outputDir, os.path.splitext(os.path.basename(bin_file))[0]
+                                  + RAW_FORMAT_EXTENSIONS[args.format])
+        if args.check:
+            report = check_bin_integrity(bin_file, args.max_bad_ratio)
+            if not report['valid']:
+                print(f'{bin_file}: omitido ({report["reason"]})')
+                failed.append(bin_file)
+                continue
+        startTime = time.time()
+        result = run_bin2csv(bin_file, outputFile, args.workers, not args.no_resume)
+        print(f'\n{bin_file} -> {outputFile}: {"OK" if result == 0 else "Error"} '
+              f'({time.time() - startTime:.1f} s)')
+        if result != 0:
+            failed.append(bin_file)
+
+    print(f'{len(binFiles) - len(failed)}/{len(binFiles)} ficheros convertidos')
+    return 1 if failed else 0
 
-#bin2csv('C:/Users/usuario/Desktop/MATA00-1004258-20240118-171307.BIN', 'C:/Users/usuario/Desktop/30min.csv')
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,81 +1,398 @@
 import csv
+import io
+import queue
+import threading
 from pathlib import Path
-from datetime import datetime, timedelta
-from processing.utils import create_path, create_empty_file
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta, tzinfo
+from processing.tasks.bin2csv_task import CsvRawWriter, csvFileHead
+from processing.segment_store import (SegmentStoreWriter, SegmentStore, format_column, REPEATED_HOUR_SUFFIX,
+                                      STORE_ROW_GROUP_ROWS)
+from processing.tasks.analisis_ritmo_task import RhythmAccumulator, clear_rhythm_stream
+from processing.memory_usage import peak_rss_mb, current_rss_mb
 import os
+import sys
 
-def run_segmentation(file):
-    outputFile = file.replace(".csv", "_processed.csv")
+COLUMNAR_EXTENSIONS = ('.parquet', '.feather')
+# Filas del 01_raw que se leen y segmentan de una vez
+RAW_CHUNK_ROWS = 1 << 18
+SEGMENT_MINUTES = 5
+# Columnas de cada tipo de segmento, en el orden de los ficheros de 02_seg
+SEGMENT_COLUMNS = {
+    'movimiento': ('dateTime', 'acc_x', 'acc_y', 'acc_z', 'gyr_x', 'gyr_y', 'gyr_z'),
+    'temperatura': ('dateTime', 'bodySurface_temp', 'ambient_temp'),
+    'hr': ('dateTime', 'hr_raw', 'hr'),
+}
+RAW_COLUMNS = tuple(dict.fromkeys(c for columns in SEGMENT_COLUMNS.values() for c in columns))
+
+MINUTE_US = 60 * 1000000
+HOUR_US = 60 * MINUTE_US
+NAIVE_EPOCH = datetime(1970, 1, 1)
+# Los cambios de hora local caen siempre en múltiplos de 15 minutos
+UTC_OFFSET_STEP = 900
+# Segmentos pendientes como máximo en la cola del hilo de escritura
+WRITE_BEHIND_SEGMENTS = 256
+# Modo con techo de memoria: memoria por fila de un bloque (lectura como cadenas,
+# arrays de tiempos y trozos de los segmentos abiertos, con margen) y bloque mínimo
+STREAM_ROW_BYTES = 1536
+MIN_STREAM_CHUNK_ROWS = 4096
+
+def read_raw_chunks(file, chunk_rows=RAW_CHUNK_ROWS):
+    """
+    Lee el fichero de 01_raw por bloques de `chunk_rows` filas y devuelve, para cada
+    bloque, un diccionario columna -> array de cadenas (object), tanto si es el CSV
+    de siempre como si es la salida columnar (Parquet/Feather) de bin2csv.
+    Las celdas vacías o nulas se devuelven como ''.
+    """
+    if not file.endswith(COLUMNAR_EXTENSIONS):
+        chunks = pd.read_csv(file, dtype=object, keep_default_na=False, encoding='utf-8-sig',
+                             usecols=list(RAW_COLUMNS), chunksize=chunk_rows)
+        for chunk in chunks:
+            yield {name: chunk[name].to_numpy(dtype=object) for name in RAW_COLUMNS}
+        return
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    if file.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(file).iter_batches(batch_size=chunk_rows, columns=list(RAW_COLUMNS))
+    else:
+        # Feather mapeado en memoria: los lotes tal como se escribieron, cortados a chunk_rows
+        reader = pa.ipc.open_file(pa.memory_map(file))
+        batches = (batch.slice(offset, chunk_rows)
+                   for batch in (reader.get_batch(i) for i in range(reader.num_record_batches))
+                   for offset in range(0, batch.num_rows, chunk_rows))
+
+    for batch in batches:
+        yield {name: pc.fill_null(pc.cast(batch.column(name), pa.string()), '').to_numpy(zero_copy_only=False)
+               for name in RAW_COLUMNS}
+
+def run_segmentation(file, store=False, rhythm=False, windows=(SEGMENT_MINUTES,), background=False,
+                     timezone=None, memory_mb=0):
+    """
+    Segmenta el 01_raw en ventanas de 5 minutos. Con `store` los segmentos van al
+    almacén de 02_seg (un Parquet por señal + segment_index.json) en lugar del árbol
+    de carpetas YYYY.MM.DD/HH. Con `rhythm` se calculan a la vez las estadísticas de
+    frecuencia cardiaca y se escriben 03_bio/HR_seg.csv y sus resúmenes.
+    `windows` son las duraciones (minutos) que se generan en la misma pasada: las de
+    5 minutos en 02_seg y el resto en 02_seg/{W}min (ver segment_windows). Con
+    `background` los ficheros de 02_seg se escriben en un hilo aparte (SegmentFileWriter).
+    Las horas de los segmentos son las de `timezone` (nombre IANA; None = la del sistema).
+
+    El 01_raw se lee siempre por bloques y los segmentos abiertos pasan de un bloque al
+    siguiente. Con `memory_mb` (> 0) el tamaño de bloque se ajusta para que el proceso no
+    pase de esos MB (ver stream_chunk_rows). Devuelve las métricas de la segmentación
+    (filas, bloques, tamaño de bloque y pico de memoria en MB).
+    """
+    outputFile = os.path.splitext(file)[0] + "_processed.csv"
     print(outputFile)
-    # Abrir el archivo de entrada CSV en modo lectura
-    with open(file, newline='', encoding='utf-8-sig') as input:
-        # Abrir el archivo de salida CSV en modo escritura
-        reader = csv.DictReader(input)
-        intervalo_mov = []
-        intervalo_temp = []
-        intervalo_hr = []
-        start = None
-
-        for row in reader:
-            try:
-                date = datetime.fromtimestamp(int(row['dateTime']) / 1000)
-
-            except:
-                date = datetime.strptime(row['dateTime'], '%Y-%m-%d %H:%M:%S.%f')
-            #intervalo = date - (date - datetime.min)% timedelta(minutes = intervalosMinutos)
-
-            if start is None:
-                start = round_interval(date, 5)
-
-            if row['bodySurface_temp'] != '':
-                intervalo_temp.append({
-                    'dateTime': row['dateTime'],
-                    'bodySurface_temp': row['bodySurface_temp'],
-                    'ambient_temp': row['ambient_temp']
-                })
-
-            if (date - start) >= timedelta(minutes= 5):
-                write_segment_csv(start, intervalo_mov, file, 'movimiento')
-                write_segment_csv(start, intervalo_temp, file, 'temperatura')
-                write_segment_csv(start, intervalo_hr, file, 'hr')
-                intervalo_temp = []
-                intervalo_mov = []
-                intervalo_hr = []
-                start = round_interval(date, 5)
-
-            intervalo_mov.append({
-                'dateTime': row['dateTime'],
-                'acc_x': row['acc_x'],
-                'acc_y': row['acc_y'],
-                'acc_z': row['acc_z'],
-                'gyr_x': row['gyr_x'],
-                'gyr_y': row['gyr_y'],
-                'gyr_z': row['gyr_z']
-            })
-
-            intervalo_hr.append({
-                'dateTime': row['dateTime'],
-                'hr_raw': row['hr_raw'],
-                'hr': row['hr']
-            })
-
-        if intervalo_mov:
-            write_segment_csv(start, intervalo_mov, file, 'movimiento')
-        if intervalo_temp:
-            write_segment_csv(start, intervalo_temp, file, 'temperatura')
-        if intervalo_hr:
-            write_segment_csv(start, intervalo_hr, file, 'hr')
-
-def round_interval(time, min):
-    roundedMinute = round(time.minute / min) * min
-    roundedHour = time.hour
-    if roundedMinute >= 60:
-        roundedMinute -= 60
-        roundedHour += 1
-    return time.replace(hour = roundedHour, minute = roundedMinute, second = 0, microsecond= 0)
-
-def write_segment_csv(start, rows, file, dato):
-    dateDir = os.path.dirname(os.path.dirname(file))
+    chunkRows = stream_chunk_rows(memory_mb, current_rss_mb(), store)
+    # Abrir el archivo de entrada (CSV o columnar) y segmentarlo por bloques
+    segmenter = MultiSegmenter(file, store, rhythm, windows, background, timezone, chunkRows)
+    rows = chunks = 0
+    for columns in read_raw_chunks(file, chunkRows):
+        segmenter.add_chunk(columns)
+        rows += len(columns['dateTime'])
+        chunks += 1
+        # Que el bloque se libere antes de leer el siguiente (nunca dos a la vez)
+        del columns
+    segmenter.close()
+
+    metrics = {'rows': rows, 'chunks': chunks, 'chunk_rows': chunkRows, 'peak_rss_mb': peak_rss_mb()}
+    if memory_mb:
+        metrics['memory_mb'] = memory_mb
+        metrics['memory_exceeded'] = metrics['peak_rss_mb'] is not None and metrics['peak_rss_mb'] > memory_mb
+    return metrics
+
+def stream_chunk_rows(memory_mb, baseline_mb=None, store=False):
+    """
+    Filas por bloque del 01_raw para que la segmentación quepa en `memory_mb` MB,
+    descontando la memoria que el proceso ya ocupa (`baseline_mb`) y estimando
+    STREAM_ROW_BYTES por fila (el doble con `store`: el almacén retiene hasta un bloque
+    más de filas pendientes de escribir). Nunca más de RAW_CHUNK_ROWS ni menos de
+    MIN_STREAM_CHUNK_ROWS; sin techo (0) se usa RAW_CHUNK_ROWS. Los segmentos abiertos
+    (hasta una ventana de la mayor duración) no entran en la cuenta.
+    """
+    if not memory_mb:
+        return RAW_CHUNK_ROWS
+    budget = (memory_mb - (baseline_mb or 0)) * 2 ** 20
+    rowBytes = STREAM_ROW_BYTES * (2 if store else 1)
+    return int(min(RAW_CHUNK_ROWS, max(MIN_STREAM_CHUNK_ROWS, budget // rowBytes)))
+
+def segment_timezone(name=None):
+    # Zona horaria configurada (nombre IANA, p. ej. 'Europe/Madrid'); vacía = la del sistema
+    if not name:
+        return None
+    from zoneinfo import ZoneInfo
+    return name if isinstance(name, tzinfo) else ZoneInfo(name)
+
+def local_offset_us(timestamp, timezone=None):
+    """
+    Desfase (µs) de la hora local en `timezone` (None = la del sistema, la de
+    datetime.fromtimestamp) respecto a UTC en el instante `timestamp` (segundos epoch),
+    y si ese instante es la segunda pasada de la hora que se repite al retrasar el reloj (fold).
+    """
+    date = datetime.fromtimestamp(timestamp, timezone).replace(tzinfo=None)
+    return (date - NAIVE_EPOCH) // timedelta(microseconds=1) - int(timestamp * 1000000), date.fold
+
+def normalize_timestamps(dateTime, timezone=None):
+    """
+    Normaliza la columna dateTime de un bloque (milisegundos epoch; o texto
+    '%Y-%m-%d %H:%M:%S.%f', ya en hora local) en tres arrays:
+      - local: microsegundos de hora local "de pared" desde 1970-01-01 (nombres de carpeta)
+      - utc: microsegundos epoch (duración real de los segmentos)
+      - fold: la fila está en la segunda pasada de la hora repetida al retrasar el reloj
+    El desfase se calcula una vez por tramo de 15 minutos (los cambios de hora caen siempre
+    en múltiplos de 15 minutos) y las filas de texto se interpretan todas de una vez.
+    """
+    numeric = pd.to_numeric(pd.Series(dateTime, dtype=object), errors='coerce')
+    invalid = numeric.isna().to_numpy()
+    ms = numeric.fillna(0).to_numpy().astype(np.int64)
+
+    steps = (ms // 1000) // UTC_OFFSET_STEP
+    uniqueSteps, inverse = np.unique(steps, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    offsets, folds = zip(*[local_offset_us(int(step) * UTC_OFFSET_STEP, timezone) for step in uniqueSteps])
+    utc = ms * 1000
+    local = utc + np.array(offsets, dtype=np.int64)[inverse]
+    fold = np.array(folds, dtype=bool)[inverse]
+
+    if invalid.any():
+        text = pd.Series(np.asarray(dateTime, dtype=object)[invalid])
+        parsed = pd.to_datetime(text, format='%Y-%m-%d %H:%M:%S.%f', errors='coerce')
+        if parsed.isna().any():
+            raise ValueError(f"dateTime no válido en el 01_raw: {text[parsed.isna()].iloc[0]!r}")
+        local[invalid] = (parsed - NAIVE_EPOCH) // pd.Timedelta(microseconds=1)
+        utc[invalid] = [round(date.replace(tzinfo=timezone).timestamp() * 1000000) for date in parsed.dt.to_pydatetime()]
+        fold[invalid] = False
+    return local, utc, fold
+
+def round_interval_us(local, min=SEGMENT_MINUTES):
+    # Inicio de segmento en microsegundos de hora local: minuto redondeado (mitades al par,
+    # como round) al múltiplo de `min`, segundos a cero; 60 pasa a la hora siguiente
+    minute = (local // MINUTE_US) % 60
+    return local // HOUR_US * HOUR_US + np.round(minute / min).astype(np.int64) * min * MINUTE_US
+
+def segment_windows(windows):
+    """
+    Duraciones de segmento a generar a partir de la configuración ("1,5,60" o una
+    lista de enteros). Siempre incluye la de 5 minutos, que es la que usan el resto
+    de fases. El redondeo del inicio de segmento solo tiene sentido para divisores de 60.
+    """
+    if isinstance(windows, str):
+        windows = [window for window in windows.replace(' ', '').split(',') if window]
+    minutes = sorted({int(window) for window in windows} | {SEGMENT_MINUTES})
+    invalid = [window for window in minutes if window <= 0 or 60 % window]
+    if invalid:
+        raise ValueError(f"Ventanas de segmentación inválidas (deben dividir 60 minutos): {invalid}")
+    return tuple(minutes)
+
+def window_dir_name(minutes):
+    # Subcarpeta de 02_seg de cada duración; la de 5 minutos es la propia 02_seg
+    return '' if minutes == SEGMENT_MINUTES else f'{minutes}min'
+
+class Segmenter:
+    """
+    Reparte las filas del 01_raw (en orden) en los ficheros de `minutes` minutos de
+    02_seg (movimiento_/temperatura_/hr_). `file` es la ruta del 01_raw de la sesión: los
+    segmentos se escriben en la carpeta 02_seg de esa misma sesión (02_seg/{W}min para
+    otras duraciones), como árbol de carpetas o, con `store`, en el almacén de segmentos
+    (SegmentStoreWriter). Con `rhythm`, cada segmento de hr escrito pasa también por un
+    RhythmAccumulator. Los ficheros se escriben con `writer` (SegmentFileWriter, compartido
+    entre varios Segmenter) o, si no se pasa, con uno propio.
+
+    Trabaja por bloques con el criterio de siempre: un segmento empieza en la hora local
+    de su primera fila redondeada al múltiplo de `minutes` (round_interval_us) y termina
+    en la primera fila que alcanza inicio + `minutes`. La temperatura de esa fila aún va
+    al segmento que se cierra; movimiento y hr, al siguiente. Como el límite de cada segmento es posterior
+    a todas las filas anteriores, esa fila es la primera cuyo máximo acumulado lo alcanza
+    y se localiza con searchsorted sobre el máximo acumulado del bloque.
+
+    Las duraciones se miden en tiempo real (UTC), no en hora local: al retrasar el reloj
+    la hora que se repite no se mezcla con la anterior y sus segmentos van a la carpeta
+    HH_2 (REPEATED_HOUR_SUFFIX). Sin cambios de hora el resultado es el mismo que con la
+    hora local.
+    """
+    def __init__(self, file, store=False, rhythm=False, minutes=SEGMENT_MINUTES, writer=None, timezone=None,
+                 chunk_rows=RAW_CHUNK_ROWS):
+        self.file = file
+        self.minutes = minutes
+        self.timezone = segment_timezone(timezone)
+        self.ownWriter = writer is None
+        self.writer = SegmentFileWriter() if writer is None else writer
+        self.store = None
+        if store:
+            # Con techo de memoria, el almacén tampoco acumula más filas que un bloque
+            self.store = SegmentStoreWriter(session_seg_dir(file, minutes), SEGMENT_COLUMNS, minutes,
+                                            min(STORE_ROW_GROUP_ROWS, chunk_rows))
+        self.rhythm = None
+        if rhythm:
+            self.rhythm = RhythmAccumulator(session_dir(file))
+        elif minutes == SEGMENT_MINUTES:
+            clear_rhythm_stream(session_dir(file))
+        self.start = None
+        self.startUtc = None
+        self.fold = False
+        self.maxTime = None
+        self.pending = {dato: [] for dato in SEGMENT_COLUMNS}
+
+    def add_chunk(self, columns):
+        # columns: columna -> secuencia de valores (cadenas del CSV o valores ya formateados)
+        columns = {name: np.asarray(columns[name], dtype=object) for name in RAW_COLUMNS}
+        if len(columns['dateTime']) == 0:
+            return
+        self.add_times(columns, normalize_timestamps(columns['dateTime'], self.timezone))
+
+    def add_times(self, columns, times):
+        # Igual que add_chunk, con las horas (normalize_timestamps) ya calculadas
+        local, utc, fold = times
+        rowCount = len(local)
+        running = np.maximum.accumulate(utc)
+        if self.maxTime is not None:
+            running = np.maximum(running, self.maxTime)
+        self.maxTime = running[-1]
+        hasTemp = columns['bodySurface_temp'] != ''
+        if self.start is None:
+            self._open(times, 0)
+
+        position = tempPosition = 0
+        while True:
+            limit = self.startUtc + self.minutes * MINUTE_US
+            transition = int(np.searchsorted(running, limit, side='left'))
+            if transition >= rowCount:
+                self._append(columns, hasTemp, position, rowCount, tempPosition, rowCount)
+                return
+            self._append(columns, hasTemp, position, transition, tempPosition, transition + 1)
+            self._write(closing=False)
+            self._open(times, transition)
+            position = transition
+            tempPosition = transition + 1
+
+    def _open(self, times, row):
+        # Nuevo segmento en la fila `row`: su hora local redondeada, pasada a UTC con
+        # el desfase de la fila. El nombre (hora local y fold) sale del desfase en ese
+        # instante, por si el redondeo cruza un cambio de hora (p. ej. 01:58 -> 03:00).
+        local, utc, fold = times
+        self.startUtc = int(round_interval_us(local[row], self.minutes)) - int(local[row] - utc[row])
+        offset, fold = local_offset_us(self.startUtc / 1000000, self.timezone)
+        self.start = self.startUtc + offset
+        self.fold = bool(fold)
+
+    def _append(self, columns, hasTemp, first, last, tempFirst, tempLast):
+        for dato in ('movimiento', 'hr'):
+            if last > first:
+                self.pending[dato].append([columns[name][first:last] for name in SEGMENT_COLUMNS[dato]])
+        if tempLast > tempFirst:
+            mask = hasTemp[tempFirst:tempLast]
+            if mask.any():
+                self.pending['temperatura'].append([columns[name][tempFirst:tempLast][mask]
+                                                    for name in SEGMENT_COLUMNS['temperatura']])
+
+    def _write(self, closing):
+        # Al cambiar de segmento se escriben los tres ficheros (aunque estén vacíos);
+        # al terminar, solo los que tienen filas
+        start = (NAIVE_EPOCH + timedelta(microseconds=self.start)).replace(fold=int(self.fold))
+        for dato, pieces in self.pending.items():
+            if pieces or not closing:
+                if self.store is not None:
+                    self.store.write_segment(start, dato, pieces)
+                else:
+                    write_segment_columns(start, pieces, self.file, dato, self.minutes, self.writer)
+                if dato == 'hr' and self.rhythm is not None:
+                    self.rhythm.add(start, np.concatenate([piece[SEGMENT_COLUMNS['hr'].index('hr')] for piece in pieces]) if pieces else [])
+        self.pending = {dato: [] for dato in SEGMENT_COLUMNS}
+
+    def close(self):
+        if self.start is not None:
+            self._write(closing=True)
+        if self.store is not None:
+            self.store.close()
+        if self.ownWriter:
+            self.writer.close()
+        if self.rhythm is not None:
+            self.rhythm.write()
+
+class MultiSegmenter:
+    """
+    Un Segmenter por cada duración de `windows`, alimentados en la misma pasada sobre
+    el 01_raw: cada bloque se lee y se convierte a hora local una sola vez. Las
+    estadísticas de hr (`rhythm`) salen de los segmentos de 5 minutos. Todos escriben
+    con el mismo SegmentFileWriter (en segundo plano con `background`).
+    """
+    def __init__(self, file, store=False, rhythm=False, windows=(SEGMENT_MINUTES,), background=False,
+                 timezone=None, chunk_rows=RAW_CHUNK_ROWS):
+        self.timezone = segment_timezone(timezone)
+        self.writer = SegmentFileWriter(background and not store)
+        self.segmenters = [Segmenter(file, store, rhythm and minutes == SEGMENT_MINUTES, minutes, self.writer,
+                                     self.timezone, chunk_rows)
+                           for minutes in segment_windows(windows)]
+
+    def add_chunk(self, columns):
+        columns = {name: np.asarray(columns[name], dtype=object) for name in RAW_COLUMNS}
+        if len(columns['dateTime']) == 0:
+            return
+        times = normalize_timestamps(columns['dateTime'], self.timezone)
+        for segmenter in self.segmenters:
+            segmenter.add_times(columns, times)
+
+    def close(self):
+        try:
+            for segmenter in self.segmenters:
+                segmenter.close()
+        finally:
+            self.writer.close()
+
+def prepare_segment_package(maxCount, sensors, accRange, gyroRange):
+    # Las celdas del CSV, todas como cadenas (str() es lo que haría el csv.writer)
+    return [list(map(str, column)) for column in CsvRawWriter.prepare_package(maxCount, sensors, accRange, gyroRange)]
+
+class SegmentRawWriter:
+    """
+    Escritor para el modo fusionado de bin2csv: en lugar de escribir el 01_raw,
+    pasa los paquetes decodificados directamente al Segmenter, con los mismos
+    valores que tendría el CSV, y genera los segmentos de 02_seg. Los paquetes se
+    acumulan hasta un bloque (RAW_CHUNK_ROWS, o menos con `memory_mb`, igual que en
+    run_segmentation).
+    """
+    # Mismo formateo que el CSV (se ejecuta en los procesos del pool si los hay)
+    prepare_package = staticmethod(prepare_segment_package)
+
+    def __init__(self, path, remarks, store=False, rhythm=False, windows=(SEGMENT_MINUTES,), background=False,
+                 timezone=None, memory_mb=0):
+        self.chunkRows = stream_chunk_rows(memory_mb, current_rss_mb(), store)
+        self.segmenter = MultiSegmenter(path, store, rhythm, windows, background, timezone, self.chunkRows)
+        self._columns = {name: [] for name in csvFileHead[0][:-1]}
+        self._rows = 0
+
+    def write_package(self, dateTime, maxCount, columns, remarks=''):
+        self._columns['dateTime'].extend(dateTime.tolist())
+        for name, values in zip(csvFileHead[0][1:-1], columns):
+            self._columns[name].extend(values)
+        self._rows += maxCount
+        if self._rows >= self.chunkRows:
+            self.flush()
+
+    def flush(self):
+        self.segmenter.add_chunk(self._columns)
+        self._columns = {name: [] for name in csvFileHead[0][:-1]}
+        self._rows = 0
+
+    def close(self):
+        self.flush()
+        self.segmenter.close()
+
+def session_dir(file):
+    # Carpeta de la sesión a la que pertenece el fichero de 01_raw
+    return os.path.dirname(os.path.dirname(file))
+
+def session_seg_dir(file, minutes=SEGMENT_MINUTES):
+    # 02_seg (o su subcarpeta de la duración) de la sesión a la que pertenece el fichero de 01_raw
+    segDir = os.path.join(session_dir(file), "02_seg")
+    return os.path.join(segDir, window_dir_name(minutes)) if window_dir_name(minutes) else segDir
+
+def segment_csv_path(start, file, dato, minutes=SEGMENT_MINUTES):
+    segDir = session_seg_dir(file, minutes)
     min = '00',
     hour = '00'
 
@@ -88,19 +405,122 @@ def write_segment_csv(start, rows, file, dato):
         hour = f"0{str(start.hour)}"
     else:
         hour = str(start.hour)
-
-    if not os.path.exists(os.path.join(dateDir, "02_seg", start.strftime('%Y.%m.%d'), hour)):
-        create_path(2, patient="", folder_name="", carpeta_dia= "", start= start)
+    if start.fold:
+        hour += REPEATED_HOUR_SUFFIX
 
     csvFile = f"{dato}_{min}.csv"
-    csvDir = Path(dateDir) / "02_seg" / start.strftime('%Y.%m.%d') / hour / csvFile
+    return Path(segDir) / start.strftime('%Y.%m.%d') / hour / csvFile
+
+def write_segment_columns(start, pieces, file, dato, minutes=SEGMENT_MINUTES, writer=None):
+    """
+    Escribe un segmento a partir de sus trozos por columnas (listas de arrays en el
+    orden de SEGMENT_COLUMNS[dato]) en 02_seg/YYYY.MM.DD/HH/{dato}_{MM}.csv, como CSV
+    con cabecera, en la carpeta de la duración `minutes`. Con `writer` (SegmentFileWriter) la escritura
+    se le delega; si no, se hace directamente.
+    """
+    csvDir = segment_csv_path(start, file, dato, minutes)
     print(csvDir)
+    text = segment_text(dato, pieces)
+    if writer is not None:
+        writer.write(csvDir, text)
+    else:
+        csvDir.parent.mkdir(parents=True, exist_ok=True)
+        with open(csvDir, mode = 'w', newline='') as output:
+            output.write(text)
+
+def segment_text(dato, pieces):
+    # Sin filas, DictWriter escribe una cabecera vacía
+    lines = [','.join(SEGMENT_COLUMNS[dato] if pieces else []) + '\r\n']
+    for piece in pieces:
+        # Las columnas de 02_seg son numéricas (no llevan comillas): se unen directamente
+        # cuando todo son cadenas y, si no, se deja al csv.writer
+        try:
+            text = '\r\n'.join(map(','.join, zip(*piece)))
+        except TypeError:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(zip(*piece))
+            lines.append(buffer.getvalue())
+            continue
+        if text:
+            lines.append(text + '\r\n')
+    return ''.join(lines)
+
+class SegmentFileWriter:
+    """
+    Escritura de los ficheros de 02_seg: cada carpeta se crea una sola vez (se guarda
+    el conjunto de las ya creadas) y cada fichero se escribe con un único open.
+    Con `background` los ficheros se escriben en un hilo aparte (write-behind) con una
+    cola de WRITE_BEHIND_SEGMENTS como máximo, para que la segmentación o la
+    decodificación no esperen al disco; un error del hilo se lanza en la siguiente
+    llamada a write o en close.
+    """
+    def __init__(self, background=False):
+        self._dirs = set()
+        self._error = None
+        self._queue = None
+        self._thread = None
+        if background:
+            self._queue = queue.Queue(maxsize=WRITE_BEHIND_SEGMENTS)
+            self._thread = threading.Thread(target=self._run, name='segment-writer', daemon=True)
+            self._thread.start()
+
+    def write(self, path, text):
+        self._raise_error()
+        if self._queue is None:
+            self._write(path, text)
+        else:
+            self._queue.put((path, text))
+
+    def _write(self, path, text):
+        folder = os.path.dirname(path)
+        if folder not in self._dirs:
+            os.makedirs(folder, exist_ok=True)
+            self._dirs.add(folder)
+        with open(path, mode='w', newline='') as output:
+            output.write(text)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is None:
+                try:
+                    self._write(*item)
+                except Exception as e:
+                    self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
 
-    if not os.path.exists(csvDir):
-        create_empty_file(csvDir)
-    fieldnames = rows[0].keys() if rows else []
+def export_segment_tree(session_path, minutes=SEGMENT_MINUTES):
+    """
+    Exportador de compatibilidad: a partir del almacén de segmentos de la sesión
+    genera el árbol 02_seg/YYYY.MM.DD/HH/{dato}_{MM}.csv de siempre (o el de
+    02_seg/{W}min para otra duración).
+    """
+    # Cualquier ruta dentro de 01_raw sirve para situar la sesión (como el fichero de 01_raw)
+    file = os.path.join(session_path, "01_raw", "")
+    store = SegmentStore(session_seg_dir(file, minutes))
+    writer = SegmentFileWriter()
+    for entry in store.segments():
+        start = store.start_of(entry)
+        for dato, (offset, rows) in entry['signals'].items():
+            table = store.read_table(entry, dato)
+            pieces = [[format_column(name, table.column(name)) for name in table.column_names]] if rows else []
+            write_segment_columns(start, pieces, file, dato, minutes, writer)
+    writer.close()
 
-    with open(csvDir, mode = 'w', newline='') as output:
-        writer = csv.DictWriter(output, fieldnames= fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
\ No newline at end of file
+if __name__ == '__main__':
+    # python -m processing.tasks.csvprocess_task <carpeta de sesión>...: exporta el almacén a carpetas
+    for sessionPath in sys.argv[1:]:
+        export_segment_tree(sessionPath)
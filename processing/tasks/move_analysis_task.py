@@ -1,16 +1,36 @@
 import subprocess
 from multiprocessing import Process
 import sys, os, datetime, json
+import secrets, socket, tempfile, time, uuid
 from processing.tasks.analisis_ritmo_task import get_rhythm
 
 bio_status, move_status = "", ""
 
+# Worker persistente de R (r_worker.R): puertos locales desde R_WORKER_PORT, uno por worker
+R_WORKER_SCRIPT = 'r_worker.R'
+R_WORKER_PORT = 47800
+R_WORKER_HOST = '127.0.0.1'
+R_WORKER_GREETING = 'READY'
+# Lo que se espera el saludo de un worker antes de darlo por ocupado y probar otro
+R_WORKER_GREETING_SECONDS = 0.5
+# Arranque de un worker nuevo (la primera vez puede instalar paquetes)
+R_WORKER_START_SECONDS = 1800
+R_WORKER_START_ATTEMPTS = 3
+R_WORKER_DIR = os.path.join(tempfile.gettempdir(), 'wpm_r_worker')
+
 def rhythm_analysis(dir_path):
     global bio_status
     get_rhythm(dir_path)
     bio_status = "OK"
 
-def movement_analysis(file_path, dir_path, patient_id):
+def movement_analysis(file_path, dir_path, patient_id, workers=0, port=R_WORKER_PORT, idle_minutes=30):
+    """
+    Ejecuta analisis_movimiento.R (GGIR) sobre el BIN de la sesión `dir_path`. Con
+    `workers` > 0 el trabajo va a un worker persistente de R (r_worker.R, hasta
+    `workers` procesos en los puertos port, port+1...) que ya tiene los paquetes
+    cargados; si no hay ninguno libre se arranca uno, que termina tras `idle_minutes`
+    sin trabajos. Con 0 se lanza un Rscript para este paciente, como siempre.
+    """
     global move_status
     try:
         # Call R script
@@ -23,20 +43,19 @@ def movement_analysis(file_path, dir_path, patient_id):
         err_json = os.path.join(logs_dir, "analisis_movimiento_error.json")
         sig_json = os.path.join(logs_dir, "ui_error_signal.json")
 
-        process = subprocess.Popen(['Rscript', file_path, dir_path, bin_folder], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace", bufsize=1)
-
-        # Ejecuta R y vuelca stdout+stderr a la vez en el log, línea a línea
-        with open(log_txt, "w", encoding="utf-8", newline="") as lf:
-            # Leer línea a línea en tiempo real
-            for line in iter(process.stdout.readline, ''):
-                if not line:
-                    break
-                print(line, end='')  # consola
-                lf.write(line)  # log
-            process.stdout.close()
-            process.wait()
+        if workers:
+            r_worker = os.path.join(os.path.dirname(file_path), R_WORKER_SCRIPT)
+            try:
+                result = run_r_worker_job(r_worker, dir_path, bin_folder, log_txt, workers, port, idle_minutes * 60)
+            except (RuntimeError, TimeoutError, OSError) as e:
+                # Ningún worker disponible (no arranca, o sigue ocupado p. ej. con una fase cancelada)
+                result = {'status': 'ERROR', 'message': str(e)}
+            print(f"R worker: {result.get('status')} en {result.get('seconds')} s (log: {log_txt}) {result.get('message') or ''}")
+            returncode = 0 if result.get('status') == 'OK' else 1
+        else:
+            returncode = run_rscript(file_path, dir_path, bin_folder, log_txt)
 
-        if process.returncode == 0:
+        if returncode == 0:
             if os.path.exists(err_json):
                 os.remove(err_json)
             # limpia la señal si existiera
@@ -69,6 +88,136 @@ def movement_analysis(file_path, dir_path, patient_id):
         #update_status_file(3, dir_path, move_status, 'move')
 
 
+def movement_batch_analysis(file_path, dir_paths, cores=0):
+    """
+    GGIR de varias sesiones a la vez (analisis_movimiento.R --batch) con `cores` núcleos
+    (0 = todos). Cada sesión recibe su salida de GGIR en 03_bio/R/output con el sello de
+    partes, así que su movement_analysis solo genera los resultados. Si el lote falla no
+    pasa nada: cada sesión ejecutará su propio GGIR. Devuelve True si el lote terminó bien.
+    """
+    cores = cores or os.cpu_count() or 1
+    logs_dir = os.path.join(dir_paths[0], "03_bio")
+    os.makedirs(logs_dir, exist_ok=True)
+    log_txt = os.path.join(logs_dir, "analisis_movimiento_batch_r.log")
+    print(f"GGIR por lotes: {len(dir_paths)} sesiones con {cores} núcleos (log: {log_txt})")
+    with open(log_txt, "w", encoding="utf-8", newline="") as lf:
+        returncode = subprocess.call(['Rscript', str(file_path), '--batch', str(cores)] + [str(path) for path in dir_paths],
+                                     stdout=lf, stderr=subprocess.STDOUT)
+    if returncode != 0:
+        print(f"GGIR por lotes falló (código {returncode}); cada sesión se analizará por separado")
+    return returncode == 0
+
+def run_rscript(file_path, dir_path, bin_folder, log_txt):
+    process = subprocess.Popen(['Rscript', file_path, dir_path, bin_folder], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace", bufsize=1)
+
+    # Ejecuta R y vuelca stdout+stderr a la vez en el log, línea a línea
+    with open(log_txt, "w", encoding="utf-8", newline="") as lf:
+        # Leer línea a línea en tiempo real
+        for line in iter(process.stdout.readline, ''):
+            if not line:
+                break
+            print(line, end='')  # consola
+            lf.write(line)  # log
+        process.stdout.close()
+        process.wait()
+    return process.returncode
+
+def run_r_worker_job(r_worker, dir_path, bin_folder, log_txt, workers=1, port=R_WORKER_PORT, idle_seconds=1800):
+    """
+    Envía el análisis de la sesión a un worker de R libre y espera su resultado
+    ({"id", "status", "message", "seconds"}). La salida de R queda en `log_txt`.
+    """
+    job = {'token': r_worker_token(), 'id': uuid.uuid4().hex, 'root_path': dir_path,
+           'bin_dir': bin_folder, 'log': log_txt}
+    connection = connect_r_worker(r_worker, workers, port, idle_seconds)
+    with connection, connection.makefile('rw', encoding='utf-8', newline='\n') as stream:
+        stream.write(json.dumps(job) + '\n')
+        stream.flush()
+        # Sin límite de tiempo: GGIR puede tardar bastante con una semana de datos
+        connection.settimeout(None)
+        line = stream.readline()
+    if not line:
+        return {'id': job['id'], 'status': 'ERROR', 'message': 'El worker de R terminó sin responder'}
+    return json.loads(line)
+
+def connect_r_worker(r_worker, workers=1, port=R_WORKER_PORT, idle_seconds=1800):
+    """
+    Conexión con un worker libre (el que responde READY). Los puertos sin worker se
+    ocupan arrancando uno nuevo; si todos están ocupados se espera a que alguno acabe.
+    """
+    started = {}
+    attempts = {}
+    deadline = time.time() + R_WORKER_START_SECONDS
+    while True:
+        for workerPort in range(port, port + workers):
+            try:
+                connection = socket.create_connection((R_WORKER_HOST, workerPort), timeout=R_WORKER_GREETING_SECONDS)
+            except OSError:
+                # Sin worker en el puerto: se arranca uno (o se reintenta si el nuestro murió)
+                process = started.get(workerPort)
+                if (process is None or process.poll() is not None) and attempts.get(workerPort, 0) < R_WORKER_START_ATTEMPTS:
+                    started[workerPort] = start_r_worker(r_worker, workerPort, idle_seconds)
+                    attempts[workerPort] = attempts.get(workerPort, 0) + 1
+                continue
+            if read_greeting(connection) == R_WORKER_GREETING:
+                return connection
+            # Ocupado con otro paciente (o todavía cargando paquetes)
+            connection.close()
+
+        if (len(attempts) == workers and all(count >= R_WORKER_START_ATTEMPTS for count in attempts.values())
+                and all(process.poll() is not None for process in started.values())):
+            codes = {workerPort: process.returncode for workerPort, process in started.items()}
+            raise RuntimeError(f"No se pudo arrancar el worker de R (códigos de salida {codes}); "
+                               f"revisa los logs de {R_WORKER_DIR}")
+        if time.time() > deadline:
+            raise TimeoutError("Ningún worker de R quedó libre a tiempo")
+        time.sleep(1)
+
+def read_greeting(connection):
+    # Primera línea del worker; vacía si no llega a tiempo
+    data = b''
+    try:
+        while not data.endswith(b'\n'):
+            chunk = connection.recv(64)
+            if not chunk:
+                break
+            data += chunk
+    except OSError:
+        return ''
+    return data.decode('utf-8', 'replace').strip()
+
+def start_r_worker(r_worker, port, idle_seconds):
+    # Proceso independiente: sigue vivo para los siguientes pacientes aunque termine esta fase
+    os.makedirs(R_WORKER_DIR, exist_ok=True)
+    env = dict(os.environ, WPM_R_WORKER_TOKEN=r_worker_token())
+    options = {}
+    if sys.platform == 'win32':
+        options['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
+    else:
+        options['start_new_session'] = True
+    with open(os.path.join(R_WORKER_DIR, f'r_worker_{port}.log'), 'a', encoding='utf-8') as logFile:
+        return subprocess.Popen(['Rscript', r_worker, str(port), str(idle_seconds)], stdin=subprocess.DEVNULL,
+                                stdout=logFile, stderr=subprocess.STDOUT, env=env, **options)
+
+def r_worker_token():
+    # Secreto compartido con los workers (solo aceptan trabajos de procesos de este usuario).
+    # Se escribe en un temporal y se enlaza con su nombre definitivo: quien lo encuentre
+    # ya tiene el token completo, y si dos procesos lo crean a la vez gana el primero
+    os.makedirs(R_WORKER_DIR, exist_ok=True)
+    tokenPath = os.path.join(R_WORKER_DIR, 'token')
+    if not os.path.exists(tokenPath):
+        descriptor, tempPath = tempfile.mkstemp(dir=R_WORKER_DIR, prefix='token.')
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as tokenFile:
+                tokenFile.write(secrets.token_hex(16))
+            os.link(tempPath, tokenPath)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tempPath)
+    with open(tokenPath, 'r', encoding='utf-8') as tokenFile:
+        return tokenFile.read().strip()
+
 def bio_analysis(dir_path, r_path, patient_id):
     # Create processes for get_rhythm and movement_analysis
     process_rhythm = Process(target=rhythm_analysis, args=(dir_path,))
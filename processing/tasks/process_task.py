@@ -1,13 +1,26 @@
 # howlab_processing/tasks/process_task.py
 import asyncio
 import time, os
+from functools import partial
 from pathlib import Path
 from processing.config import settings
-from processing.utils import create_path
-from processing.tasks.bin2csv_task import run_bin2csv
-from processing.tasks.csvprocess_task import run_segmentation
-from processing.tasks.analisis_ritmo_task import get_rhythm
-from processing.tasks.move_analysis_task import movement_analysis
+from processing.utils import create_path, raw_file_path, find_raw_file
+from processing.phases import record_phase_metrics
+from processing.memory_usage import peak_rss_mb
+from processing.tasks.bin2csv_task import run_bin2csv, check_bin_integrity, write_integrity_report
+from processing.tasks.csvprocess_task import run_segmentation, SegmentRawWriter
+from processing.tasks.analisis_ritmo_task import get_rhythm, has_streamed_rhythm
+from processing.tasks.move_analysis_task import movement_analysis, movement_batch_analysis
+
+def validate_bin_file(bin_path) -> dict:
+    """
+    Comprueba la integridad del BIN (CRC32, tamaños, huecos de tiempo) y guarda
+    el informe bin_integrity.json en 00_bin. Devuelve el informe.
+    """
+    report = check_bin_integrity(bin_path, settings.bin_max_bad_ratio)
+    if os.path.isdir(os.path.dirname(bin_path)):
+        write_integrity_report(bin_path, report)
+    return report
 
 async def bin2csv(record, only_this_step: bool = False):
     # record es dict con 'id', 'fecha', etc.
@@ -21,13 +34,32 @@ async def bin2csv(record, only_this_step: bool = False):
     create_path(1, patient, folder)
     raw_status = "RUNNING"
 
+    bin_path = os.path.join(datos_paciente, '00_bin', f"{folder}.BIN")
+    report = await asyncio.to_thread(validate_bin_file, bin_path)
+    if not report['valid']:
+        print(f"BIN rechazado ({bin_path}): {report['reason']}")
+        raise ValueError(f"BIN dañado: {report['reason']}")
+
+    # Modo fusionado: los segmentos de 02_seg se escriben al decodificar, sin 01_raw
+    writer_factory = None
+    if settings.fused_segmentation:
+        create_path(2, patient, folder)
+        writer_factory = partial(SegmentRawWriter, store=settings.seg_storage == 'store',
+                                 rhythm=settings.stream_rhythm, windows=settings.seg_windows,
+                                 background=settings.seg_write_behind,
+                                 timezone=settings.seg_timezone, memory_mb=settings.seg_memory_mb)
+
     start_time = time.time()
-    conversion_result = await asyncio.to_thread(run_bin2csv, os.path.join(datos_paciente, '00_bin', f"{folder}.BIN"),
-                                                os.path.join(datos_paciente, '01_raw', f"{folder}.csv"))
+    conversion_result = await asyncio.to_thread(run_bin2csv, bin_path,
+                                                raw_file_path(os.path.join(datos_paciente, '01_raw'), folder, settings.raw_format),
+                                                settings.bin2csv_workers, True, writer_factory)
     end_time = time.time()
     elapsed_time = end_time - start_time
     print(f'Conversion to CSV time: {elapsed_time}')
     raw_status = "OK" if conversion_result == 0 else "Error"
+    # En modo fusionado la segmentación va dentro de bin2csv: su pico de memoria queda en bin2csv.json
+    record_phase_metrics(os.path.join(datos_paciente, '01_raw', 'bin2csv.json'),
+                         elapsed_seconds=round(elapsed_time, 1), peak_rss_mb=peak_rss_mb())
 
     #if not only_this_step:
     #    await seg_csv(record)
@@ -42,13 +74,23 @@ async def seg_csv(record, only_this_step: bool = False):
     create_path(2, patient, folder)
     seg_status = "Started"
 
+    if settings.fused_segmentation:
+        # Los segmentos ya se generaron en la fase bin2csv
+        print('CSV segmentation: segmentos generados en bin2csv (modo fusionado)')
+        return
+
     # Ejecutar segmentación y actualizar estado
     start_time = time.time()
     try:
-        await asyncio.to_thread(run_segmentation, os.path.join(datos_paciente, '01_raw', f"{folder}.csv"))
+        raw_file = find_raw_file(os.path.join(datos_paciente, '01_raw'), folder, settings.raw_format)
+        metrics = await asyncio.to_thread(run_segmentation, raw_file, settings.seg_storage == 'store',
+                                          settings.stream_rhythm, settings.seg_windows, settings.seg_write_behind,
+                                          settings.seg_timezone, settings.seg_memory_mb)
         end_time = time.time()
         elapsed_time = end_time - start_time
         print(f'CSV segmentation time: {elapsed_time}')
+        record_phase_metrics(os.path.join(datos_paciente, '02_seg', 'seg_csv.json'),
+                             elapsed_seconds=round(elapsed_time, 1), **metrics)
         seg_status = "OK"
     except Exception:
         seg_status = "ERROR"
@@ -66,8 +108,13 @@ async def bio_analisis(record, only_this_step: bool = False):
     create_path(3, patient, folder)
     bio_status = "Started"
 
+    if has_streamed_rhythm(datos_paciente):
+        # HR_seg.csv y HR_day.csv ya se generaron durante la segmentación
+        print('Rhythm Analysis: estadísticas de HR generadas en la segmentación')
+        return
+
     start_time = time.time()
-    await asyncio.to_thread(get_rhythm, os.path.join(datos_paciente))
+    await asyncio.to_thread(get_rhythm, os.path.join(datos_paciente), settings.rhythm_workers)
     end_time = time.time()
     elapsed_time = end_time - start_time
     print(f'Rhythm Analysis time: {elapsed_time}')
@@ -87,13 +134,35 @@ async def move_analisis(record, only_this_step: bool = False):
 
     start_time = time.time()
     r_script = Path(settings.base_directory).parent / "processing" / "tasks" / 'analisis_movimiento.R'
-    await asyncio.to_thread(movement_analysis, r_script, datos_paciente, patient)
+    batch = move_batch_dirs(datos_paciente, record.get('batch', []))
+    if len(batch) > 1:
+        await asyncio.to_thread(movement_batch_analysis, r_script, batch, settings.move_batch_cores)
+    await asyncio.to_thread(movement_analysis, r_script, datos_paciente, patient,
+                            workers=settings.r_workers, port=settings.r_worker_port,
+                            idle_minutes=settings.r_worker_idle_minutes)
     end_time = time.time()
     elapsed_time = end_time - start_time
     print(f'Movement Analysis time: {elapsed_time}')
 
     # await create_report(record)
 
+def move_batch_dirs(datos_paciente, queued):
+    """
+    Sesiones para el GGIR por lotes: esta y las de `queued` ([(id, fecha)] de los pacientes
+    en cola que van a ejecutar analisis_movimiento) que tienen BIN y todavía no tienen salida de GGIR (sello ggir_parts.dcf),
+    hasta MOVE_BATCH_SIZE. Con una sola no hay lote.
+    """
+    batch = []
+    for folder in [datos_paciente] + [os.path.join(os.getcwd(), "Datos_pacientes", patient, f"{patient}_{date_str.replace('-', '.')}")
+                                      for patient, date_str in queued]:
+        if len(batch) >= settings.move_batch_size:
+            break
+        bin_dir = os.path.join(folder, '00_bin')
+        has_bin = os.path.isdir(bin_dir) and any(name.lower().endswith('.bin') for name in os.listdir(bin_dir))
+        if has_bin and folder not in batch and not os.path.exists(os.path.join(folder, '03_bio', 'R', 'output', 'ggir_parts.dcf')):
+            batch.append(folder)
+    return batch
+
 async def create_report(record):
     patient = record['id']
     date_str = record['fecha']
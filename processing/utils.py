@@ -1,5 +1,5 @@
 # utils.py
-import json, shutil
+import json, os, shutil
 from datetime import datetime
 from pathlib import Path
 from processing.config import settings
@@ -43,6 +43,31 @@ def create_path(step: int, patient: str, folder_name: str, carpeta_dia: str = No
             return base
     return base
 
+RAW_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+def raw_file_path(raw_dir, folder_name: str, raw_format: str = 'csv') -> str:
+    """
+    Ruta del fichero de 01_raw para el formato configurado (csv, parquet o feather).
+    """
+    extension = RAW_EXTENSIONS.get(raw_format.lower())
+    if not extension:
+        raise ValueError(f"Formato de 01_raw inválido: {raw_format}")
+    return os.path.join(raw_dir, f"{folder_name}{extension}")
+
+def find_raw_file(raw_dir, folder_name: str, raw_format: str = 'csv') -> str | None:
+    """
+    Busca el fichero de 01_raw de la sesión, primero en el formato configurado
+    y después en el resto, por si la conversión se hizo con otra configuración.
+    """
+    formats = [raw_format.lower()] + [f for f in RAW_EXTENSIONS if f != raw_format.lower()]
+    for fmt in formats:
+        if fmt not in RAW_EXTENSIONS:
+            continue
+        path = raw_file_path(raw_dir, folder_name, fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
 def create_empty_file(file_path: Path):
     try:
         file_path.parent.mkdir(parents=True, exist_ok=True)